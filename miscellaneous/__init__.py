@@ -1,17 +1,125 @@
-from miscellaneous.ask_mapbox_for_image import ask_mapbox_for_image
-from miscellaneous.clean_overlapping_bboxes import clean_overlapping_bboxes
+"""Utilities of the dataset pipeline and of the training.
+
+The submodules needing torch (training) or osmnx (acquisition) are only
+imported on first access to one of their names, so that e.g. the scripts of
+rapport/ can use the label index without loading either.
+"""
+
+import importlib
+
+from miscellaneous.ask_mapbox_for_image import LazyTileImage, ask_mapbox_for_image
+from miscellaneous.build_manifest import BuildManifest
+from miscellaneous.class_mapping import ClassMapping, load_class_mapping
+from miscellaneous.clean_overlapping_bboxes import (
+    clean_overlapping_bboxes,
+    clean_overlapping_bboxes_until_stable,
+)
+from miscellaneous.clean_overlapping_bboxes_many import clean_overlapping_bboxes_many
+from miscellaneous.cluster_overlapping_bboxes import cluster_overlapping_bboxes
 from miscellaneous.create_bbox_from_city_coordinates import create_bbox_from_city_coordinates
-from miscellaneous.create_bbox_from_coordinates import create_bbox_from_coordinates
-from miscellaneous.get_random_points_in_bbox import get_random_points_in_bbox
-from miscellaneous.make_a_gif_for_coordinates import make_a_gif_for_coordinates
-from miscellaneous.format_yolo_labels import format_yolo_labels
+from miscellaneous.create_bbox_from_coordinates import (
+    create_bbox_from_coordinates,
+    create_bboxes_from_coordinates,
+)
+from miscellaneous.get_transformer import get_transformer
+from miscellaneous.get_random_points_in_bbox import (
+    get_random_points_in_bbox,
+    sample_points_in_bbox,
+    sample_points_in_bboxes,
+)
+from miscellaneous.label_index import LabelIndex, image_id_of
+from miscellaneous.feature_cache import FeatureCache
+from miscellaneous.format_yolo_labels import (
+    format_yolo_labels,
+    write_yolo_labels,
+    write_yolo_labels_many,
+    yolo_label_array,
+)
+from miscellaneous.mapbox_image_fetcher import MapboxImageFetcher
+from miscellaneous.merge_axis_aligned_boxes import merge_axis_aligned_boxes
+from miscellaneous.resilience import CircuitBreaker, Retrying, RetryBudgetExceeded
+from miscellaneous.tile_cache import TileCache
+
+# Names of the submodules importing torch or osmnx, imported on first access
+_LAZY_SUBMODULES = {
+    "acquisition_pipeline": (
+        "acquire_tiles",
+        "read_tile_coordinates",
+        "run_acquisition_pipeline",
+        "tile_bboxes_from_csv",
+    ),
+    "batch_augmentation": ("BatchAugmentation", "flip_rot90_batch", "mosaic_batch"),
+    "build_dataset": ("build_dataset",),
+    "building_store": ("BuildingStore",),
+    "data_loading": ("YoloDetectionDataset", "benchmark_data_loader", "make_data_loader", "yolo_collate_fn"),
+    "make_a_gif_for_coordinates": ("make_a_gif_for_coordinates",),
+    "packed_dataset": ("PackedYoloDataset", "images_to_float", "is_packed", "pack_yolo_dataset"),
+    "region_prefetcher": ("RegionPrefetcher",),
+    "training_precision": ("TrainingPrecision",),
+}
+_LAZY_NAMES = {name: submodule for submodule, names in _LAZY_SUBMODULES.items() for name in names}
 
 __all__ = [
+    "acquire_tiles",
+    "run_acquisition_pipeline",
+    "read_tile_coordinates",
+    "tile_bboxes_from_csv",
     "clean_overlapping_bboxes",
+    "clean_overlapping_bboxes_until_stable",
+    "clean_overlapping_bboxes_many",
+    "cluster_overlapping_bboxes",
     "create_bbox_from_coordinates",
+    "create_bboxes_from_coordinates",
     "create_bbox_from_city_coordinates",
     "get_random_points_in_bbox",
+    "sample_points_in_bbox",
+    "sample_points_in_bboxes",
+    "get_transformer",
     "ask_mapbox_for_image",
+    "LazyTileImage",
     "make_a_gif_for_coordinates",
-    "format_yolo_labels"
+    "format_yolo_labels",
+    "write_yolo_labels",
+    "write_yolo_labels_many",
+    "yolo_label_array",
+    "merge_axis_aligned_boxes",
+    "MapboxImageFetcher",
+    "TileCache",
+    "Retrying",
+    "CircuitBreaker",
+    "RetryBudgetExceeded",
+    "build_dataset",
+    "BuildManifest",
+    "BuildingStore",
+    "RegionPrefetcher",
+    "FeatureCache",
+    "ClassMapping",
+    "load_class_mapping",
+    "pack_yolo_dataset",
+    "is_packed",
+    "PackedYoloDataset",
+    "images_to_float",
+    "YoloDetectionDataset",
+    "yolo_collate_fn",
+    "make_data_loader",
+    "benchmark_data_loader",
+    "LabelIndex",
+    "image_id_of",
+    "BatchAugmentation",
+    "flip_rot90_batch",
+    "mosaic_batch",
+    "TrainingPrecision",
 ]
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_LAZY_NAMES[name]}"), name)
+    # set after the import, which binds the submodule of the same name, if any, to the package
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
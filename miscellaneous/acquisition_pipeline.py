@@ -0,0 +1,330 @@
+"""asyncio pipeline fetching images and OSM buildings of many tiles concurrently.
+
+Stages, connected by bounded queues so a slow stage holds back the ones before it:
+
+    coordinates ──► fetch (Mapbox image ‖ OSM buildings) ──► crop, clean & label ──► files
+
+Each upstream has its own token bucket, so throughput is bound by the allowed
+request rates rather than by latency.
+"""
+
+import asyncio
+import os
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+import geopandas as gpd
+import osmnx as ox
+import pandas as pd
+from osmnx._errors import InsufficientResponseError
+from PIL import Image
+
+from miscellaneous.class_mapping import ClassMapping
+from miscellaneous.clean_overlapping_bboxes import clean_overlapping_bboxes
+from miscellaneous.create_bbox_from_coordinates import create_bbox_from_coordinates
+from miscellaneous.format_yolo_labels import write_yolo_labels
+from miscellaneous.mapbox_image_fetcher import MapboxImageFetcher
+from miscellaneous.resilience import Retrying
+
+WATERMARK_HEIGHT = 30
+
+
+class TokenBucket:
+    """Async rate limiter: allows *rate* acquisitions per second, in bursts of up to *capacity*.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (int, optional): Maximum number of tokens stored. Defaults to 1.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError("Rate must be positive.")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class TileOutcome:
+    """What happened to one tile of the pipeline.
+
+    Attributes:
+        tile_id (str): Identifier used in the output file names.
+        n_boxes (int | None): Number of labelled boxes, None if OSM had no building there.
+        error (str | None): Error message if the tile failed.
+    """
+
+    tile_id: str
+    n_boxes: int | None = None
+    error: str | None = None
+
+
+def tile_bboxes(
+    lat: float,
+    lon: float,
+    width: int,
+    height: int,
+    pixel_size: float = 0.4,
+) -> tuple[dict[str, float], tuple[float, float, float, float]]:
+    """Bboxes of a tile centered on (*lat*, *lon*), as in the pipeline notebook.
+
+    Args:
+        lat (float): Latitude of the center of the tile.
+        lon (float): Longitude of the center of the tile.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels, watermark included.
+        pixel_size (float, optional): Size of a pixel in meters. Defaults to 0.4.
+
+    Returns:
+        tuple: bbox of the Mapbox image (watermark included) as a dict, and
+        (west, south, east, north) bbox of the buildings (watermark excluded).
+    """
+    image_bbox = create_bbox_from_coordinates(lat, lon, img_height=height, img_width=width, pixel_size=pixel_size)
+    bbox_polyg = create_bbox_from_coordinates(
+        lat, lon, img_height=height - WATERMARK_HEIGHT, img_width=width, pixel_size=pixel_size
+    )
+    return image_bbox, (bbox_polyg["west"], bbox_polyg["south"], bbox_polyg["east"], bbox_polyg["north"])
+
+
+def read_tile_coordinates(coordinates_csv: str | Path) -> dict[str, tuple[float, float]]:
+    """(latitude, longitude) of each tile id of a CSV with latitude and longitude columns.
+
+    Tile ids are the 1-based row numbers, as in the pipeline notebook.
+    """
+    coords = pd.read_csv(coordinates_csv)
+    return {str(i + 1): (row.latitude, row.longitude) for i, row in enumerate(coords.itertuples(index=False))}
+
+
+def tile_bboxes_from_csv(
+    coordinates_csv: str | Path,
+    width: int = 512,
+    height: int = 512 + WATERMARK_HEIGHT,
+    pixel_size: float = 0.4,
+) -> dict[str, tuple[float, float, float, float]]:
+    """(west, south, east, north) bbox of the buildings of each tile id of a coordinates CSV.
+
+    These are the bboxes the labels are computed in, e.g. the *tile_bboxes* of
+    `clean_overlapping_bboxes_many`, and the queries of the `FeatureCache`.
+
+    Args:
+        coordinates_csv (str | Path): CSV with latitude and longitude columns.
+        width (int, optional): Image width in pixels. Defaults to 512.
+        height (int, optional): Image height in pixels, watermark included. Defaults to 542.
+        pixel_size (float, optional): Size of a pixel in meters. Defaults to 0.4.
+
+    Returns:
+        dict[str, tuple[float, float, float, float]]: bbox of each tile id (see `read_tile_coordinates`).
+    """
+    return {
+        tile_id: tile_bboxes(lat, lon, width, height, pixel_size)[1]
+        for tile_id, (lat, lon) in read_tile_coordinates(coordinates_csv).items()
+    }
+
+
+def fetch_osm_buildings(
+    bbox: tuple[float, float, float, float],
+    retrying: Retrying | None = None,
+) -> gpd.GeoDataFrame | None:
+    """Fetch the OSM buildings of a (west, south, east, north) bbox, None if there is none.
+
+    Args:
+        bbox (tuple[float, float, float, float]): (west, south, east, north) bbox.
+        retrying (Retrying | None, optional): Retries the query on transient errors.
+            Defaults to None (a single attempt).
+    """
+    try:
+        if retrying is None:
+            return ox.features_from_bbox(bbox=bbox, tags={"building": True})
+        return retrying.call(ox.features_from_bbox, bbox=bbox, tags={"building": True})
+    except InsufficientResponseError:
+        return None
+
+
+def process_tile(
+    tile_id: str,
+    image_bytes: bytes,
+    features: gpd.GeoDataFrame | None,
+    polygon_bbox: tuple[float, float, float, float],
+    class_mapping: ClassMapping,
+    data_dir: Path,
+    threshold: float,
+) -> int | None:
+    """CPU stage of a tile: save and crop the image, then clean and label the buildings.
+
+    Writes the same files as the pipeline notebook, under *data_dir*.
+
+    Returns:
+        int | None: number of labelled boxes, None if there was no building.
+    """
+    (data_dir / "raw_images" / f"image_{tile_id}.png").write_bytes(image_bytes)
+
+    image = Image.open(BytesIO(image_bytes))
+    cropped_image = image.crop((0, 0, image.width, image.height - WATERMARK_HEIGHT))
+    cropped_image.save(data_dir / "cropped_images" / f"image_{tile_id}.png")
+
+    if features is None:
+        return None
+
+    features = features.copy()
+    features["category_of_building"] = class_mapping.categories(features["building"])
+    features.to_file(data_dir / "raw_polygons" / f"features_{tile_id}.geojson", driver="GeoJSON")
+
+    gdf_bbox = features.copy()
+    gdf_bbox["geometry"] = gdf_bbox["geometry"].envelope
+    gdf_cleaned = clean_overlapping_bboxes(gdf_bbox, threshold=threshold)
+
+    return write_yolo_labels(
+        gdf_cleaned, polygon_bbox, data_dir / "cleaned_polygons" / f"image_{tile_id}.txt", class_mapping
+    )
+
+
+async def run_acquisition_pipeline(
+    coordinates: Mapping[str, tuple[float, float]],
+    image_fetcher: MapboxImageFetcher,
+    data_dir: str | Path,
+    mapping_file: str | Path,
+    fetch_buildings: Callable[[tuple[float, float, float, float]], gpd.GeoDataFrame | None] = fetch_osm_buildings,
+    mapbox_rate: float = 5.0,
+    osm_rate: float = 1.0,
+    max_concurrent_fetches: int = 8,
+    queue_size: int = 16,
+    cpu_executor: Executor | None = None,
+    cpu_workers: int | None = None,
+    threshold: float = 0.3,
+    pixel_size: float = 0.4,
+    osm_retrying: Retrying | None = None,
+) -> list[TileOutcome]:
+    """Acquire many tiles, fetching their image and their buildings concurrently.
+
+    For every tile, the image bbox (with the 30px watermark) and the buildings
+    bbox are built as in the pipeline notebook. The Mapbox image and the OSM
+    buildings are fetched at the same time, each upstream under its own rate
+    limit, while up to *max_concurrent_fetches* tiles are in flight. Cropping,
+    cleaning and labelling run on *cpu_executor*. Transient errors of both
+    upstreams are retried: by the retry policy of *image_fetcher* for Mapbox and
+    by *osm_retrying* for OSM. A tile failing anyway is reported and skipped.
+
+    Args:
+        coordinates (Mapping[str, tuple[float, float]]): (latitude, longitude) of each tile id.
+        image_fetcher (MapboxImageFetcher): Fetcher of the Mapbox images. Its
+            image size must include the watermark.
+        data_dir (str | Path): Data directory, containing raw_images, cropped_images,
+            raw_polygons and cleaned_polygons.
+        mapping_file (str | Path): JSON mapping of OSM building tags to our categories.
+        fetch_buildings (Callable, optional): Returns the buildings of a
+            (west, south, east, north) bbox, or None. Defaults to an osmnx query.
+        mapbox_rate (float, optional): Maximum Mapbox requests per second. Defaults to 5.
+        osm_rate (float, optional): Maximum OSM requests per second. Defaults to 1.
+        max_concurrent_fetches (int, optional): Number of tiles being fetched at once. Defaults to 8.
+        queue_size (int, optional): Capacity of the queues between stages. Defaults to 16.
+        cpu_executor (Executor | None, optional): Executor running the CPU stage.
+            Defaults to None (a process pool of *cpu_workers* processes).
+        cpu_workers (int | None, optional): Number of tiles in the CPU stage at once.
+            Defaults to None (one per CPU).
+        threshold (float, optional): Overlap threshold used for cleaning. Defaults to 0.3.
+        pixel_size (float, optional): Size of a pixel in meters. Defaults to 0.4.
+        osm_retrying (Retrying | None, optional): Retry policy of the OSM queries, shared
+            by all the tiles. Defaults to None (a `Retrying` with default settings).
+
+    Returns:
+        list[TileOutcome]: Outcome of every tile, in the order of *coordinates*.
+    """
+    data_dir = Path(data_dir)
+    for sub_dir in ("raw_images", "cropped_images", "raw_polygons", "cleaned_polygons"):
+        (data_dir / sub_dir).mkdir(parents=True, exist_ok=True)
+    class_mapping = ClassMapping.from_files(mapping_file)
+
+    width = image_fetcher.image_width_height["width"]
+    height = image_fetcher.image_width_height["height"]
+
+    loop = asyncio.get_running_loop()
+    io_executor = ThreadPoolExecutor(max_workers=2 * max_concurrent_fetches)
+    cpu_workers = cpu_workers or os.cpu_count() or 1
+    owns_cpu_executor = cpu_executor is None
+    cpu_executor = cpu_executor or ProcessPoolExecutor(max_workers=cpu_workers)
+
+    osm_retrying = osm_retrying or Retrying()
+    mapbox_bucket = TokenBucket(mapbox_rate)
+    osm_bucket = TokenBucket(osm_rate)
+    to_fetch: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    to_process: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    outcomes: dict[str, TileOutcome] = {}
+
+    async def fetch_image(image_bbox: dict[str, float]) -> bytes:
+        await mapbox_bucket.acquire()
+        return await loop.run_in_executor(io_executor, image_fetcher.fetch_bytes, image_bbox)
+
+    async def fetch_features(polygon_bbox: tuple[float, float, float, float]) -> gpd.GeoDataFrame | None:
+        await osm_bucket.acquire()
+        return await loop.run_in_executor(io_executor, osm_retrying.call, fetch_buildings, polygon_bbox)
+
+    async def produce() -> None:
+        for tile_id, (lat, lon) in coordinates.items():
+            await to_fetch.put((tile_id, lat, lon))
+        for _ in range(max_concurrent_fetches):
+            await to_fetch.put(None)
+
+    async def fetch_worker() -> None:
+        while (item := await to_fetch.get()) is not None:
+            tile_id, lat, lon = item
+            image_bbox, polygon_bbox = tile_bboxes(lat, lon, width, height, pixel_size)
+            try:
+                image_bytes, features = await asyncio.gather(
+                    fetch_image(image_bbox), fetch_features(polygon_bbox)
+                )
+            except Exception as e:
+                outcomes[tile_id] = TileOutcome(tile_id, error=repr(e))
+                continue
+            await to_process.put((tile_id, image_bytes, features, polygon_bbox))
+
+    async def process_worker() -> None:
+        while (item := await to_process.get()) is not None:
+            tile_id, image_bytes, features, polygon_bbox = item
+            try:
+                n_boxes = await loop.run_in_executor(
+                    cpu_executor, process_tile,
+                    tile_id, image_bytes, features, polygon_bbox, class_mapping, data_dir, threshold,
+                )
+                outcomes[tile_id] = TileOutcome(tile_id, n_boxes=n_boxes)
+            except Exception as e:
+                outcomes[tile_id] = TileOutcome(tile_id, error=repr(e))
+
+    try:
+        processors = [asyncio.create_task(process_worker()) for _ in range(cpu_workers)]
+        await asyncio.gather(produce(), *(fetch_worker() for _ in range(max_concurrent_fetches)))
+        for _ in processors:
+            await to_process.put(None)
+        await asyncio.gather(*processors)
+    finally:
+        io_executor.shutdown(wait=False)
+        if owns_cpu_executor:
+            cpu_executor.shutdown()
+
+    return [outcomes[tile_id] for tile_id in coordinates]
+
+
+def acquire_tiles(*args, **kwargs) -> list[TileOutcome]:
+    """Synchronous wrapper of `run_acquisition_pipeline`, for scripts.
+
+    In a notebook, which already runs an event loop, await `run_acquisition_pipeline` instead.
+    """
+    return asyncio.run(run_acquisition_pipeline(*args, **kwargs))
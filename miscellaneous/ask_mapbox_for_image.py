@@ -4,27 +4,87 @@ from pathlib import Path
 import requests
 from PIL import Image
 
+from miscellaneous.resilience import Retrying
 
-def ask_mapbox_for_image(
+MAPBOX_STATIC_URL = "https://api.mapbox.com/styles/v1"
+MAPBOX_STYLE = "mapbox/satellite-v9"
+
+
+class LazyTileImage:
+    """Encoded image bytes, decoded only when pixels are needed.
+
+    The bytes can be written to disk as they are, without decoding. The image is
+    decoded at most once, on first access to its pixels, e.g. to crop the
+    watermark. Other attributes (size, save, ...) are those of the decoded
+    PIL image.
+
+    Args:
+        data (bytes): Encoded image, as returned by the server.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self._image: Image.Image | None = None
+
+    def decode(self) -> Image.Image:
+        """Decode the image, or return the already decoded one."""
+        if self._image is None:
+            self._image = Image.open(BytesIO(self.data))
+            self._image.load()
+        return self._image
+
+    def crop(self, box: tuple[int, int, int, int]) -> Image.Image:
+        """Crop the decoded image, see `PIL.Image.Image.crop`."""
+        return self.decode().crop(box)
+
+    def save_raw(self, output_file: Path) -> None:
+        """Write the encoded bytes to *output_file* without decoding them.
+
+        If the encoding does not match the file extension (e.g. JPEG bytes to a
+        .png file), the image is decoded and re-encoded instead.
+        """
+        output_file = Path(output_file)
+        expected_format = Image.registered_extensions().get(output_file.suffix.lower())
+        if Image.open(BytesIO(self.data)).format == expected_format:
+            output_file.write_bytes(self.data)
+        else:
+            self.decode().save(output_file)
+
+    def __getstate__(self) -> dict:
+        # copies and pickles carry the bytes only, and decode again if needed
+        return {"data": self.data, "_image": None}
+
+    def __getattr__(self, name: str):
+        # private and special names (e.g. looked up by copy and pickle on an
+        # instance without attributes yet) are not delegated to the image
+        if name.startswith("_"):
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        return getattr(self.decode(), name)
+
+
+def build_mapbox_url(
     image_width_height: dict[str, int],
     mapbox_token: str,
     bounding_box: dict[str, float],
-    request_timeout: int = 10,
-    output_file: Path | bool = False,
-) -> Image.Image:
-    """Ask Mapbox for a satellite image of a given bounding box.
+    style: str = MAPBOX_STYLE,
+    base_url: str = MAPBOX_STATIC_URL,
+) -> str:
+    """Build the Mapbox Static Images API URL of a bounding box.
 
     Args:
         image_width_height (dict[str, int]): Dictionary with keys 'width' and 'height' for image dimensions.
         mapbox_token (str): Mapbox access token.
         bounding_box (dict[str, float]): Dictionary with keys 'west', 'south', 'east', 'north' for bounding box coordinates.
-        request_timeout (int, optional): Timeout for the Mapbox API request in seconds. Defaults to 10 seconds.
-        output_file (Path | bool, optional): Path to save the output image. If False, no file is saved. Defaults to False.
+        style (str, optional): Mapbox style id. Defaults to "mapbox/satellite-v9".
+        base_url (str, optional): Root of the styles API. Defaults to the Mapbox one.
 
     Raises:
         ValueError: If bounding box coordinates are not provided.
         ValueError: If Mapbox access token is not provided.
         ValueError: If image width or height is not provided.
+
+    Returns:
+        str: URL of the static image.
     """
     west = bounding_box.get("west", None)
     south = bounding_box.get("south", None)
@@ -43,14 +103,55 @@ def ask_mapbox_for_image(
     if None in [image_width, image_height]:
         raise ValueError("Image width and height must be provided.")
 
-    img_url: str = (
-        "https://api.mapbox.com/styles/v1/mapbox/satellite-v9/static/"
+    return (
+        f"{base_url}/{style}/static/"
         f"[{west},{south},{east},{north}]/{image_width}x{image_height}"
         f"?access_token={mapbox_token}"
     )
 
-    img = requests.get(img_url, timeout=request_timeout).content
+
+def ask_mapbox_for_image(
+    image_width_height: dict[str, int],
+    mapbox_token: str,
+    bounding_box: dict[str, float],
+    request_timeout: int = 10,
+    output_file: Path | bool = False,
+    lazy: bool = False,
+    retrying: Retrying | None = None,
+) -> Image.Image | LazyTileImage:
+    """Ask Mapbox for a satellite image of a given bounding box.
+
+    The image is saved as received from Mapbox, without being decoded and
+    re-encoded.
+
+    Args:
+        image_width_height (dict[str, int]): Dictionary with keys 'width' and 'height' for image dimensions.
+        mapbox_token (str): Mapbox access token.
+        bounding_box (dict[str, float]): Dictionary with keys 'west', 'south', 'east', 'north' for bounding box coordinates.
+        request_timeout (int, optional): Timeout for the Mapbox API request in seconds. Defaults to 10 seconds.
+        output_file (Path | bool, optional): Path to save the output image. If False, no file is saved. Defaults to False.
+        lazy (bool, optional): Return a LazyTileImage, decoded only when its pixels
+            are used, instead of a PIL image. Defaults to False.
+        retrying (Retrying | None, optional): Retries the request on transient errors
+            (timeouts, 429, 5xx). Defaults to None (a single attempt).
+
+    Raises:
+        ValueError: If bounding box coordinates are not provided.
+        ValueError: If Mapbox access token is not provided.
+        ValueError: If image width or height is not provided.
+        requests.HTTPError: If Mapbox answers with an error status.
+
+    Returns:
+        Image.Image | LazyTileImage: the satellite image.
+    """
+    img_url: str = build_mapbox_url(image_width_height, mapbox_token, bounding_box)
+
+    def download() -> bytes:
+        response = requests.get(img_url, timeout=request_timeout)
+        response.raise_for_status()
+        return response.content
+
+    image = LazyTileImage(retrying.call(download) if retrying else download())
     if output_file:
-        image = Image.open(BytesIO(img))
-        image.save(output_file)
-    return image
+        image.save_raw(output_file)
+    return image if lazy else image.decode()
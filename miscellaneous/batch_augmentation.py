@@ -0,0 +1,271 @@
+"""Geometric augmentation of whole collated batches: flips, 90° rotations and mosaic, boxes included.
+
+Batches are (B, C, H, W) image tensors of any dtype with the (M, 6) targets
+[img_idx, class_id, x, y, w, h] of `yolo_collate_fn`, coordinates normalized
+to [0, 1]. Everything runs with tensor ops on the device of the batch.
+"""
+
+import torch
+
+
+def _xywh_to_xyxy(xywh: torch.Tensor) -> torch.Tensor:
+    xy, wh = xywh[:, :2], xywh[:, 2:]
+    return torch.cat((xy - wh / 2, xy + wh / 2), 1)
+
+
+def _xyxy_to_xywh(xyxy: torch.Tensor) -> torch.Tensor:
+    return torch.cat(((xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]), 1)
+
+
+def flip_rot90_batch(
+    imgs: torch.Tensor,
+    targets: torch.Tensor,
+    hflip: torch.Tensor,
+    vflip: torch.Tensor,
+    k: torch.Tensor,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Flip then rotate every image of a batch by its own parameters, and its boxes with it.
+
+    Images drawing the same (hflip, vflip, k) are transformed together, so a
+    batch costs at most one op per distinct transform rather than one per image.
+
+    Args:
+        imgs (torch.Tensor): (B, C, H, W) images.
+        targets (torch.Tensor): (M, 6) [img_idx, class_id, x, y, w, h] targets.
+        hflip (torch.Tensor): (B,) bool, flip left-right.
+        vflip (torch.Tensor): (B,) bool, flip upside-down.
+        k (torch.Tensor): (B,) int, number of 90° counterclockwise rotations, after the flips.
+
+    Raises:
+        ValueError: If an image is rotated by 90° or 270° but is not square.
+
+    Returns:
+        tuple[torch.Tensor, torch.Tensor]: the transformed images and targets.
+    """
+    k = k.long() % 4
+    if imgs.shape[2] != imgs.shape[3] and bool((k % 2 == 1).any()):
+        raise ValueError(f"90° rotations need square images, got {tuple(imgs.shape[2:])}.")
+
+    hflip, vflip, k = hflip.to(imgs.device), vflip.to(imgs.device), k.to(imgs.device)
+    codes = hflip.long() * 8 + vflip.long() * 4 + k
+    out = imgs.clone() if bool((codes != 0).any()) else imgs
+    for code in codes.unique().tolist():
+        if code == 0:
+            continue
+        sel = codes == code
+        x = imgs[sel]
+        if code & 8:
+            x = x.flip(3)
+        if code & 4:
+            x = x.flip(2)
+        if code % 4:
+            x = torch.rot90(x, code % 4, dims=(2, 3))
+        out[sel] = x
+
+    if not len(targets):
+        return out, targets
+    targets = targets.clone()
+    img_idx = targets[:, 0].long()
+    hflip, vflip, k = hflip.to(targets.device), vflip.to(targets.device), k.to(targets.device)
+    x, y, w, h = targets[:, 2].clone(), targets[:, 3].clone(), targets[:, 4].clone(), targets[:, 5].clone()
+    x = torch.where(hflip[img_idx], 1.0 - x, x)
+    y = torch.where(vflip[img_idx], 1.0 - y, y)
+    # one counterclockwise quarter turn maps (x, y, w, h) to (y, 1 - x, h, w)
+    rot = k[img_idx]
+    odd = rot % 2 == 1
+    new_x = torch.where(rot == 0, x, torch.where(rot == 1, y, torch.where(rot == 2, 1.0 - x, 1.0 - y)))
+    new_y = torch.where(rot == 0, y, torch.where(rot == 1, 1.0 - x, torch.where(rot == 2, 1.0 - y, x)))
+    targets[:, 2], targets[:, 3] = new_x, new_y
+    targets[:, 4], targets[:, 5] = torch.where(odd, h, w), torch.where(odd, w, h)
+    return out, targets
+
+
+def mosaic_batch(
+    imgs: torch.Tensor,
+    targets: torch.Tensor,
+    sources: torch.Tensor,
+    center: tuple[float, float],
+    min_box_fraction: float = 0.25,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Assemble every image of a batch from the quadrants of four images of the batch.
+
+    The batch is cut in four quadrants around *center*. Quadrant q of output
+    image b is the same quadrant of image `sources[b, q]`, at its native
+    scale (ground resolution is unchanged).
+
+    An output whose four quadrants come from the same image is that image,
+    with its targets unchanged. Otherwise, each box is clipped to the
+    quadrants of its image; the pieces of a box in several such quadrants
+    are merged back into one box. Boxes are dropped if less than
+    *min_box_fraction* of their area is left.
+
+    Args:
+        imgs (torch.Tensor): (B, C, H, W) images.
+        targets (torch.Tensor): (M, 6) [img_idx, class_id, x, y, w, h] targets.
+        sources (torch.Tensor): (B, 4) int, image of each quadrant (top left, top right,
+            bottom left, bottom right) of each output image.
+        center (tuple[float, float]): (x, y) normalized center of the mosaic.
+        min_box_fraction (float, optional): Minimum area of a box left in its quadrants,
+            relative to its full area. Defaults to 0.25.
+
+    Returns:
+        tuple[torch.Tensor, torch.Tensor]: the mosaic images and their targets.
+    """
+    _, _, height, width = imgs.shape
+    cx, cy = round(center[0] * width), round(center[1] * height)
+    sources = sources.long().to(imgs.device)
+
+    out = torch.empty_like(imgs)
+    pixel_regions = [
+        (slice(0, cy), slice(0, cx)),
+        (slice(0, cy), slice(cx, width)),
+        (slice(cy, height), slice(0, cx)),
+        (slice(cy, height), slice(cx, width)),
+    ]
+    for q, (rows, cols) in enumerate(pixel_regions):
+        out[:, :, rows, cols] = imgs[sources[:, q], :, rows, cols]
+
+    if not len(targets):
+        return out, targets
+
+    device = targets.device
+    sources = sources.to(device)
+    # rows of image i in the targets sorted by image are order[starts[i]:starts[i] + counts[i]]
+    img_idx = targets[:, 0].long()
+    order = torch.argsort(img_idx, stable=True)
+    counts = torch.bincount(img_idx, minlength=len(imgs))
+    starts = torch.cumsum(counts, 0) - counts
+
+    def rows_of(src: torch.Tensor, selected: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """Output index and target row of every row of image src[b], for the selected outputs b."""
+        n = torch.where(selected, counts[src], 0)
+        outputs = torch.repeat_interleave(torch.arange(len(src), device=device), n)
+        within = torch.arange(int(n.sum()), device=device) - torch.repeat_interleave(torch.cumsum(n, 0) - n, n)
+        return outputs, order[starts[src][outputs] + within]
+
+    single = (sources == sources[:, :1]).all(1)
+    outputs, row_ids = rows_of(sources[:, 0], single)
+    kept = targets[row_ids].clone()
+    kept[:, 0] = outputs.to(kept.dtype)
+
+    # pieces of the boxes in every quadrant of the mosaics, one per quadrant of their image
+    ncx, ncy = cx / width, cy / height
+    regions = torch.tensor(
+        [[0.0, 0.0, ncx, ncy], [ncx, 0.0, 1.0, ncy], [0.0, ncy, ncx, 1.0], [ncx, ncy, 1.0, 1.0]],
+        dtype=targets.dtype,
+        device=device,
+    )
+    piece_outputs, piece_rows, pieces = [], [], []
+    for q in range(4):
+        outputs, row_ids = rows_of(sources[:, q], ~single)
+        xyxy = _xywh_to_xyxy(targets[row_ids, 2:])
+        clipped = torch.maximum(torch.minimum(xyxy, regions[q, 2:].repeat(2)), regions[q, :2].repeat(2))
+        piece_outputs.append(outputs)
+        piece_rows.append(row_ids)
+        pieces.append(clipped)
+    piece_outputs, piece_rows, pieces = torch.cat(piece_outputs), torch.cat(piece_rows), torch.cat(pieces)
+    piece_areas = (pieces[:, 2] - pieces[:, 0]).clamp(min=0) * (pieces[:, 3] - pieces[:, 1]).clamp(min=0)
+    visible = piece_areas > 0
+    piece_outputs, piece_rows, pieces, piece_areas = (
+        piece_outputs[visible], piece_rows[visible], pieces[visible], piece_areas[visible]
+    )
+
+    # merge the pieces of each (output, box) into the box around them
+    keys, inverse = torch.unique(piece_outputs * len(targets) + piece_rows, return_inverse=True)
+    index = inverse[:, None].expand(-1, 2)
+    merged = torch.cat(
+        (
+            torch.zeros(len(keys), 2, dtype=pieces.dtype, device=device).scatter_reduce(
+                0, index, pieces[:, :2], "amin", include_self=False
+            ),
+            torch.zeros(len(keys), 2, dtype=pieces.dtype, device=device).scatter_reduce(
+                0, index, pieces[:, 2:], "amax", include_self=False
+            ),
+        ),
+        1,
+    )
+    visible_area = torch.zeros(len(keys), dtype=pieces.dtype, device=device).index_add_(0, inverse, piece_areas)
+    merged_rows = keys % len(targets)
+    full_area = targets[merged_rows, 4] * targets[merged_rows, 5]
+    keep = visible_area >= min_box_fraction * full_area
+
+    mosaic_targets = targets[merged_rows[keep]].clone()
+    mosaic_targets[:, 0] = (keys[keep] // len(targets)).to(mosaic_targets.dtype)
+    mosaic_targets[:, 2:] = _xyxy_to_xywh(merged[keep])
+
+    new_targets = torch.cat((kept, mosaic_targets))
+    return out, new_targets[torch.argsort(new_targets[:, 0], stable=True)]
+
+
+class BatchAugmentation:
+    """Random flips, 90° rotations and mosaic of collated batches, after the DataLoader.
+
+    Replaces the per-sample flips of `YoloDetectionDataset` (a numpy copy of
+    the image per flip) with batched tensor ops, on the device of the
+    batch: move the batch to the GPU first, then augment it. Nadir
+    satellite images have no preferred orientation, so the 8 flips and
+    rotations of a tile are all valid samples.
+
+    Draws come from *generator*, or from the global torch RNG (seeded by
+    `set_seed`) if None, so augmentations are reproducible.
+
+    Args:
+        flip_p (float, optional): Probability of each of the horizontal and vertical
+            flips. Defaults to 0.5.
+        rot90_p (float, optional): Probability of a rotation by 90°, 180° or 270°
+            (equally likely). Defaults to 0.5.
+        mosaic_p (float, optional): Probability that an image is replaced by a mosaic
+            of 4 images of the batch. Defaults to 0.0.
+        min_box_fraction (float, optional): Minimum area of a box kept in a mosaic,
+            relative to its full area. Defaults to 0.25.
+        generator (torch.Generator | None, optional): CPU generator of the random draws.
+            Defaults to None.
+
+    Raises:
+        ValueError: If a probability is not in [0, 1].
+    """
+
+    def __init__(
+        self,
+        flip_p: float = 0.5,
+        rot90_p: float = 0.5,
+        mosaic_p: float = 0.0,
+        min_box_fraction: float = 0.25,
+        generator: torch.Generator | None = None,
+    ) -> None:
+        for name, p in (("flip_p", flip_p), ("rot90_p", rot90_p), ("mosaic_p", mosaic_p)):
+            if not 0.0 <= p <= 1.0:
+                raise ValueError(f"{name} must be in [0, 1], got {p}.")
+        self.flip_p = flip_p
+        self.rot90_p = rot90_p
+        self.mosaic_p = mosaic_p
+        self.min_box_fraction = min_box_fraction
+        self.generator = generator
+
+    def _rand(self, *size: int) -> torch.Tensor:
+        return torch.rand(size, generator=self.generator)
+
+    def __call__(self, imgs: torch.Tensor, targets: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """Augmented copy of a batch of images and its [img_idx, class_id, x, y, w, h] targets."""
+        batch_size = len(imgs)
+
+        if self.mosaic_p > 0 and batch_size > 1:
+            is_mosaic = self._rand(batch_size) < self.mosaic_p
+            if bool(is_mosaic.any()):
+                # the other quadrants come from random images of the batch
+                others = torch.randint(0, batch_size, (batch_size, 3), generator=self.generator)
+                own = torch.arange(batch_size)
+                sources = torch.column_stack(
+                    (own, torch.where(is_mosaic[:, None], others, own[:, None].expand(-1, 3)))
+                )
+                center = (0.25 + 0.5 * self._rand(2)).tolist()
+                imgs, targets = mosaic_batch(imgs, targets, sources, center, self.min_box_fraction)
+
+        hflip = self._rand(batch_size) < self.flip_p
+        vflip = self._rand(batch_size) < self.flip_p
+        k = torch.where(
+            self._rand(batch_size) < self.rot90_p,
+            torch.randint(1, 4, (batch_size,), generator=self.generator),
+            torch.zeros(batch_size, dtype=torch.long),
+        )
+        return flip_rot90_batch(imgs, targets, hflip, vflip, k)
@@ -0,0 +1,286 @@
+"""Resumable dataset build: the steps of the pipeline notebook, checkpointed in a `BuildManifest`.
+
+Run it as a script, as many times as needed; every run skips the work already done:
+
+    python -m miscellaneous.build_dataset --coordinates data/.coordinates_and_mapping/coords_to_retrieve.csv
+
+Several runs can share the same manifest at once, each tile is built by a single one.
+"""
+
+import json
+import os
+import socket
+from collections.abc import Callable, Mapping
+from pathlib import Path
+
+import geopandas as gpd
+
+from miscellaneous.acquisition_pipeline import WATERMARK_HEIGHT, fetch_osm_buildings, read_tile_coordinates, tile_bboxes
+from miscellaneous.ask_mapbox_for_image import LazyTileImage
+from miscellaneous.build_manifest import STAGES, BuildManifest
+from miscellaneous.class_mapping import ClassMapping
+from miscellaneous.clean_overlapping_bboxes import clean_overlapping_bboxes
+from miscellaneous.feature_cache import BUILDING_TAGS, FeatureCache, read_cached_features
+from miscellaneous.format_yolo_labels import write_yolo_labels
+from miscellaneous.mapbox_image_fetcher import MapboxImageFetcher
+from miscellaneous.resilience import Retrying
+
+
+def stage_outputs(tile_id: str, data_dir: Path) -> dict[str, list[Path]]:
+    """Files each stage of a tile may write, with the names used by the pipeline notebook."""
+    return {
+        "image": [
+            data_dir / "raw_images" / f"image_{tile_id}.png",
+            data_dir / "cropped_images" / f"image_{tile_id}.png",
+        ],
+        "polygons": [data_dir / "raw_polygons" / f"features_{tile_id}.geojson"],
+        "cleaned": [data_dir / "cleaned_polygons" / f"cleaned_features_{tile_id}.geojson"],
+        "labels": [data_dir / "cleaned_polygons" / f"image_{tile_id}.txt"],
+    }
+
+
+def _bbox_key(bbox: tuple[float, float, float, float], precision: int = 7) -> str:
+    """Manifest input key of a stage querying a (west, south, east, north) bbox, rounded to *precision* decimals."""
+    return json.dumps([round(float(side), precision) for side in bbox])
+
+
+def _build_tile(
+    tile_id: str,
+    manifest: BuildManifest,
+    data_dir: Path,
+    class_mapping: ClassMapping,
+    image_fetcher: MapboxImageFetcher,
+    fetch_buildings: Callable[[tuple[float, float, float, float]], gpd.GeoDataFrame | None],
+    osm_retrying: Retrying,
+    threshold: float,
+    pixel_size: float,
+    feature_cache: FeatureCache | None = None,
+) -> str:
+    """Run the stale stages of one tile.
+
+    Stages without building (no polygons, nothing left after cleaning) write
+    no file, and remove the file of a previous build. With a *feature_cache*,
+    the polygons are its file for the tile bbox rather than a GeoJSON file.
+
+    Returns:
+        str: "complete", or "failed" at the first stage raising an error.
+    """
+    lat, lon = manifest.coordinates(tile_id)
+    image_bbox, polygon_bbox = tile_bboxes(
+        lat,
+        lon,
+        image_fetcher.image_width_height["width"],
+        image_fetcher.image_width_height["height"],
+        pixel_size,
+    )
+    outputs = stage_outputs(tile_id, data_dir)
+    if feature_cache is not None:
+        outputs["polygons"] = [feature_cache.path(polygon_bbox, BUILDING_TAGS)]
+    (raw_image, cropped_image), (raw_polygons,), (cleaned_polygons,), (labels,) = (
+        outputs[stage] for stage in STAGES
+    )
+
+    def build_image() -> list[Path]:
+        image = LazyTileImage(image_fetcher.fetch_bytes(image_bbox))
+        image.save_raw(raw_image)
+        image.crop((0, 0, image.width, image.height - WATERMARK_HEIGHT)).save(cropped_image)
+        return [raw_image, cropped_image]
+
+    def build_polygons() -> list[Path]:
+        if feature_cache is not None:
+            # the cache file is written even for a tile without building
+            osm_retrying.call(feature_cache.cached(fetch_buildings), polygon_bbox)
+            return [raw_polygons]
+        features = osm_retrying.call(fetch_buildings, polygon_bbox)
+        if features is None:
+            raw_polygons.unlink(missing_ok=True)
+            return []
+        features = features.copy()
+        features["category_of_building"] = class_mapping.categories(features["building"])
+        features.to_file(raw_polygons, driver="GeoJSON")
+        return [raw_polygons]
+
+    def build_cleaned() -> list[Path]:
+        if raw_polygons.exists():
+            if feature_cache is not None:
+                gdf_bbox = read_cached_features(raw_polygons, ["building", "category_of_building"])
+            else:
+                gdf_bbox = gpd.read_file(raw_polygons)
+            gdf_bbox["geometry"] = gdf_bbox["geometry"].envelope
+            gdf_cleaned = clean_overlapping_bboxes(gdf_bbox, threshold=threshold)
+            if len(gdf_cleaned):
+                gdf_cleaned.to_file(cleaned_polygons, driver="GeoJSON")
+                return [cleaned_polygons]
+        cleaned_polygons.unlink(missing_ok=True)
+        return []
+
+    def build_labels() -> list[Path]:
+        if not cleaned_polygons.exists():
+            labels.unlink(missing_ok=True)
+            return []
+        write_yolo_labels(gpd.read_file(cleaned_polygons), polygon_bbox, labels, class_mapping)
+        return [labels]
+
+    builders = {"image": build_image, "polygons": build_polygons, "cleaned": build_cleaned, "labels": build_labels}
+    # the buildings depend on the queried bbox, not on the bytes of the image
+    input_keys = {"polygons": _bbox_key(polygon_bbox)}
+    for stage in STAGES:
+        input_key = input_keys.get(stage)
+        if manifest.is_fresh(tile_id, stage, [path for path in outputs[stage] if path.exists()], input_key):
+            continue
+        try:
+            written = builders[stage]()
+        except Exception as e:
+            manifest.record(tile_id, stage, error=repr(e), input_key=input_key)
+            return "failed"
+        manifest.record(tile_id, stage, written, input_key=input_key)
+    return "complete"
+
+
+def build_dataset(
+    coordinates: Mapping[str, tuple[float, float]],
+    data_dir: str | Path,
+    mapping_file: str | Path,
+    manifest: BuildManifest | str | Path,
+    image_fetcher: MapboxImageFetcher,
+    fetch_buildings: Callable[[tuple[float, float, float, float]], gpd.GeoDataFrame | None] = fetch_osm_buildings,
+    osm_retrying: Retrying | None = None,
+    worker_id: str | None = None,
+    batch_size: int = 8,
+    retry_failed: bool = True,
+    verify: bool = False,
+    threshold: float = 0.3,
+    pixel_size: float = 0.4,
+    feature_cache: FeatureCache | None = None,
+) -> dict[str, dict[str, int]]:
+    """Build the tiles of *coordinates*, resuming from the state recorded in *manifest*.
+
+    Tiles go through the stages of the pipeline notebook: image (raw and
+    cropped), polygons (OSM buildings with their category), cleaned (envelopes
+    without overlaps) and labels (YOLO). Each stage is recorded in the
+    manifest with the hash of its files; stages still fresh are skipped, so an
+    interrupted build resumes where it stopped.
+
+    Args:
+        coordinates (Mapping[str, tuple[float, float]]): (latitude, longitude) of each tile id.
+            Tiles already in the manifest keep their recorded coordinates.
+        data_dir (str | Path): Data directory, containing raw_images, cropped_images,
+            raw_polygons and cleaned_polygons.
+        mapping_file (str | Path): JSON mapping of OSM building tags to our categories.
+        manifest (BuildManifest | str | Path): Manifest, or path of its SQLite file.
+        image_fetcher (MapboxImageFetcher): Fetcher of the Mapbox images. Its image
+            size must include the watermark.
+        fetch_buildings (Callable, optional): Returns the buildings of a
+            (west, south, east, north) bbox, or None. Defaults to an osmnx query.
+        osm_retrying (Retrying | None, optional): Retry policy of *fetch_buildings*.
+            Defaults to None (a `Retrying` with default settings).
+        worker_id (str | None, optional): Name of this worker in the manifest.
+            Defaults to None (host name and process id).
+        batch_size (int, optional): Number of tiles claimed at once. Defaults to 8.
+        retry_failed (bool, optional): Build again the tiles that failed in
+            previous runs. Defaults to True.
+        verify (bool, optional): Check again the hashes of the tiles completed in
+            previous runs, rebuilding their stale stages. Defaults to False.
+        threshold (float, optional): Overlap threshold used for cleaning. Defaults to 0.3.
+        pixel_size (float, optional): Size of a pixel in meters. Defaults to 0.4.
+        feature_cache (FeatureCache | None, optional): Cache holding the buildings of
+            every tile, read by the cleaning stage instead of the GeoJSON files of
+            raw_polygons. Defaults to None.
+
+    Returns:
+        dict[str, dict[str, int]]: `BuildManifest.summary` at the end of the run.
+    """
+    data_dir = Path(data_dir)
+    for sub_dir in ("raw_images", "cropped_images", "raw_polygons", "cleaned_polygons"):
+        (data_dir / sub_dir).mkdir(parents=True, exist_ok=True)
+    class_mapping = ClassMapping.from_files(mapping_file)
+
+    owns_manifest = not isinstance(manifest, BuildManifest)
+    if owns_manifest:
+        manifest = BuildManifest(manifest)
+    osm_retrying = osm_retrying or Retrying()
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+    try:
+        manifest.add_tiles(coordinates)
+        reset_states = (["failed"] if retry_failed else []) + (["complete"] if verify else [])
+        if reset_states:
+            manifest.reset(reset_states)
+
+        while tile_ids := manifest.claim(worker_id, batch_size):
+            for tile_id in tile_ids:
+                state = _build_tile(
+                    tile_id, manifest, data_dir, class_mapping,
+                    image_fetcher, fetch_buildings, osm_retrying, threshold, pixel_size, feature_cache,
+                )
+                manifest.release(tile_id, state)
+                print(f"{state} tile {tile_id}")
+        return manifest.summary()
+    finally:
+        # tiles claimed but not built (error, interruption) go back to the other workers now,
+        # rather than when their lease expires
+        manifest.release_claims(worker_id)
+        if owns_manifest:
+            manifest.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+    from dotenv import load_dotenv
+
+    from miscellaneous.building_store import BuildingStore
+    from miscellaneous.create_bbox_from_city_coordinates import create_bbox_from_city_coordinates
+    from miscellaneous.region_prefetcher import RegionPrefetcher
+    from miscellaneous.tile_cache import TileCache
+
+    parser = argparse.ArgumentParser(description="Build the dataset, resuming from the manifest.")
+    parser.add_argument("--coordinates", required=True, help="CSV with latitude and longitude columns")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--mapping-file", default="data/.coordinates_and_mapping/osm_to_category_mapping.json")
+    parser.add_argument("--manifest", default="data/build_manifest.sqlite")
+    parser.add_argument("--image-cache-dir", default=None, help="cache of the Mapbox tiles")
+    parser.add_argument("--osm-extract", default=None, help=".osm.pbf or GeoPackage of buildings, instead of Overpass")
+    parser.add_argument("--feature-cache-dir", default=None, help="GeoParquet cache of the OSM buildings")
+    parser.add_argument("--city-coords", default=None, help="CSV of the cities (city, lat, lng), queried once each")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--no-retry-failed", action="store_true", help="skip the tiles that failed before")
+    parser.add_argument("--verify", action="store_true", help="check again the tiles completed before")
+    args = parser.parse_args()
+
+    load_dotenv()
+    MAPBOX_TOKEN = os.getenv("MAPBOX_ACCESS_TOKEN")
+    if not MAPBOX_TOKEN:
+        raise ValueError("MAPBOX_ACCESS_TOKEN not found in environment variables")
+
+    # tile ids are the 1-based row numbers, as in the pipeline notebook
+    coordinates = read_tile_coordinates(args.coordinates)
+
+    cache = TileCache(args.image_cache_dir) if args.image_cache_dir else None
+    fetch_buildings = BuildingStore.from_file(args.osm_extract).fetch_buildings if args.osm_extract else fetch_osm_buildings
+    feature_cache = None
+    if args.feature_cache_dir:
+        feature_cache = FeatureCache(args.feature_cache_dir, class_mapping=ClassMapping.from_files(args.mapping_file))
+    if args.city_coords:
+        # with a feature cache, whole regions are cached as well as tiles
+        regions = {
+            row.city: create_bbox_from_city_coordinates(row.lat, row.lng, width=10, height=10)
+            for row in pd.read_csv(args.city_coords).itertuples(index=False)
+        }
+        fetch_region = feature_cache.cached(fetch_buildings) if feature_cache else fetch_buildings
+        fetch_buildings = RegionPrefetcher(regions, fetch_region=fetch_region, fallback=fetch_buildings).fetch_buildings
+    with MapboxImageFetcher(MAPBOX_TOKEN, {"width": 512, "height": 512 + WATERMARK_HEIGHT}, cache=cache) as fetcher:
+        summary = build_dataset(
+            coordinates,
+            args.data_dir,
+            args.mapping_file,
+            args.manifest,
+            fetcher,
+            fetch_buildings=fetch_buildings,
+            batch_size=args.batch_size,
+            retry_failed=not args.no_retry_failed,
+            verify=args.verify,
+            feature_cache=feature_cache,
+        )
+    print(json.dumps(summary, indent=2))
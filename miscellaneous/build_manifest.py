@@ -0,0 +1,236 @@
+"""SQLite manifest of a dataset build: state and output hashes of every stage of every tile."""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+
+STAGES = ("image", "polygons", "cleaned", "labels")
+# Stage whose outputs each stage is built from; None for the stages built from the tile alone,
+# keyed on what the caller gives (e.g. the bbox of the query)
+STAGE_INPUTS = {"image": None, "polygons": None, "cleaned": "polygons", "labels": "cleaned"}
+TILE_STATES = ("pending", "complete", "failed")
+
+
+def hash_files(paths: Iterable[Path]) -> str:
+    """SHA-256 of the names and contents of *paths*, "missing" if one of them does not exist.
+
+    An empty list of paths has a valid hash, for stages without output (e.g. no building).
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        if not path.is_file():
+            return "missing"
+        digest.update(path.name.encode() + b"\0")
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """Tracks which stages of which tiles are built, so that a build can resume where it stopped.
+
+    Every stage of a tile records its status ("done" or "failed"), the hash of
+    its output files, and its input: the hash of the outputs of the stage it
+    was built from (see `STAGE_INPUTS`), or the *input_key* given by the
+    caller for the stages built from the tile alone. A stage is fresh when it
+    is done, its files still have the recorded hash, and its input has not
+    changed since. Anything else (never run, failed, files edited or deleted,
+    upstream rebuilt, other query) is stale and gets rebuilt.
+
+    A tile is "pending" until a worker builds it, then "complete" or "failed".
+    Several worker processes can share one manifest: `claim` hands out each
+    pending tile to a single worker, with a lease that expires if the worker dies,
+    and `release_claims` gives back those a worker stops without building.
+
+    Args:
+        path (str | Path): SQLite file of the manifest, created if needed.
+        lease_seconds (float, optional): Time after which a claimed tile that
+            was not released can be claimed again. Defaults to 600.
+    """
+
+    def __init__(self, path: str | Path, lease_seconds: float = 600.0) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            " tile_id TEXT PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'pending', claimed_by TEXT, claimed_at REAL);"
+            "CREATE TABLE IF NOT EXISTS stages ("
+            " tile_id TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL,"
+            " output_hash TEXT, input_hash TEXT, error TEXT, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (tile_id, stage));"
+        )
+
+    def close(self) -> None:
+        """Close the manifest."""
+        self._db.close()
+
+    def add_tiles(self, coordinates: Mapping[str, tuple[float, float]]) -> None:
+        """Register tiles by id with their (latitude, longitude); known tiles are left unchanged."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO tiles (tile_id, lat, lon) VALUES (?, ?, ?)",
+                ((str(tile_id), float(lat), float(lon)) for tile_id, (lat, lon) in coordinates.items()),
+            )
+            self._db.execute("COMMIT")
+
+    def coordinates(self, tile_id: str) -> tuple[float, float]:
+        """(latitude, longitude) of a tile."""
+        with self._lock:
+            return self._db.execute("SELECT lat, lon FROM tiles WHERE tile_id = ?", (tile_id,)).fetchone()
+
+    def claim(self, worker_id: str, limit: int = 1) -> list[str]:
+        """Atomically claim up to *limit* pending tiles that no live worker holds.
+
+        Returns:
+            list[str]: the claimed tile ids, empty when nothing is left to build.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                tile_ids = [
+                    tile_id for (tile_id,) in self._db.execute(
+                        "SELECT tile_id FROM tiles WHERE state = 'pending'"
+                        " AND (claimed_by IS NULL OR claimed_at < ?) ORDER BY rowid LIMIT ?",
+                        (now - self.lease_seconds, limit),
+                    )
+                ]
+                self._db.executemany(
+                    "UPDATE tiles SET claimed_by = ?, claimed_at = ? WHERE tile_id = ?",
+                    ((worker_id, now, tile_id) for tile_id in tile_ids),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return tile_ids
+
+    def release(self, tile_id: str, state: str) -> None:
+        """Give a claimed tile back in *state* ("complete" or "failed").
+
+        Raises:
+            ValueError: If the state is unknown.
+        """
+        if state not in TILE_STATES:
+            raise ValueError(f"Unknown state {state!r}, expected one of {TILE_STATES}.")
+        with self._lock:
+            self._db.execute(
+                "UPDATE tiles SET claimed_by = NULL, claimed_at = NULL, state = ? WHERE tile_id = ?",
+                (state, tile_id),
+            )
+
+    def release_claims(self, worker_id: str) -> int:
+        """Give back the tiles *worker_id* claimed but did not release, still pending, to the other workers.
+
+        Returns:
+            int: number of tiles given back.
+        """
+        with self._lock:
+            return self._db.execute(
+                "UPDATE tiles SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ? AND state = 'pending'",
+                (worker_id,),
+            ).rowcount
+
+    def reset(self, states: Iterable[str] = ("failed",)) -> int:
+        """Put the tiles in *states* back to "pending", so that the next claims check their stages again.
+
+        Returns:
+            int: number of tiles reset.
+        """
+        states = tuple(states)
+        with self._lock:
+            return self._db.execute(
+                f"UPDATE tiles SET state = 'pending' WHERE state IN ({', '.join('?' * len(states))})",
+                states,
+            ).rowcount
+
+    def _stage(self, tile_id: str, stage: str) -> tuple[str, str | None, str | None] | None:
+        return self._db.execute(
+            "SELECT status, output_hash, input_hash FROM stages WHERE tile_id = ? AND stage = ?",
+            (tile_id, stage),
+        ).fetchone()
+
+    def _input_hash(self, tile_id: str, stage: str, input_key: str | None = None) -> str | None:
+        """Recorded output hash of the input stage of *stage*, *input_key* for the stages without one."""
+        upstream = STAGE_INPUTS[stage]
+        if upstream is None:
+            return input_key
+        previous = self._stage(tile_id, upstream)
+        return previous[1] if previous else None
+
+    def is_fresh(self, tile_id: str, stage: str, outputs: Iterable[Path], input_key: str | None = None) -> bool:
+        """Whether *stage* of *tile_id* is done and neither its *outputs* nor its input changed since.
+
+        *input_key* identifies the input of the stages without input stage, e.g.
+        the bbox they query; it is ignored for the others.
+        """
+        with self._lock:
+            row = self._stage(tile_id, stage)
+            if row is None or row[0] != "done":
+                return False
+            _, output_hash, input_hash = row
+            if input_hash != self._input_hash(tile_id, stage, input_key):
+                return False
+        return output_hash == hash_files(outputs)
+
+    def record(
+        self,
+        tile_id: str,
+        stage: str,
+        outputs: Iterable[Path] = (),
+        error: str | None = None,
+        input_key: str | None = None,
+    ) -> None:
+        """Record that *stage* of *tile_id* just succeeded with *outputs*, or failed with *error*.
+
+        *input_key* is recorded as the input of the stages without input stage (see `is_fresh`).
+
+        Raises:
+            ValueError: If the stage is unknown.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage!r}, expected one of {STAGES}.")
+        output_hash = None if error is not None else hash_files(outputs)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stages"
+                " (tile_id, stage, status, output_hash, input_hash, error, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    tile_id,
+                    stage,
+                    "failed" if error is not None else "done",
+                    output_hash,
+                    self._input_hash(tile_id, stage, input_key),
+                    error,
+                    time.time(),
+                ),
+            )
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        """Number of tiles per status of every stage, and per state.
+
+        Returns:
+            dict[str, dict[str, int]]: e.g. {"image": {"done": 10, "failed": 1}, ...,
+            "tiles": {"complete": 9, "failed": 1, "pending": 2}}.
+        """
+        with self._lock:
+            summary: dict[str, dict[str, int]] = {stage: {} for stage in STAGES}
+            for stage, status, count in self._db.execute(
+                "SELECT stage, status, COUNT(*) FROM stages GROUP BY stage, status"
+            ):
+                summary[stage][status] = count
+            summary["tiles"] = dict(self._db.execute("SELECT state, COUNT(*) FROM tiles GROUP BY state").fetchall())
+        return summary
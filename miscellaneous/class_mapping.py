@@ -0,0 +1,146 @@
+"""Mapping of OSM building tags to our categories and to the YOLO class ids of the dataset."""
+
+import json
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+MAPPING_FILE = PROJECT_DIR / "data" / ".coordinates_and_mapping" / "osm_to_category_mapping.json"
+DATA_YAML = PROJECT_DIR / "dataset" / "data.yaml"
+
+# category of the OSM tags that belong to none of our classes
+UNCLASSIFIED = "Non_classifie"
+
+# Class id of the OSM building tags in the label files, any other tag gets UNCLASSIFIED_ID
+CLASS_IDS = {
+    'house': 1,
+    'apartments': 2
+}
+UNCLASSIFIED_ID = 0
+
+
+class ClassMapping:
+    """Mapping of OSM building tags to categories (e.g. "Maison") and to YOLO class ids.
+
+    Categories come from the JSON mapping; tags missing from it are
+    "Non_classifie". Class ids come from *tag_ids*, by default those the
+    label files have always used (`CLASS_IDS`). With `tag_ids=None`, they
+    are derived from the categories instead: a category is the class of the
+    same name in *class_names*, case-insensitively ("Maison" is class "maison").
+
+    Tags without a class id get the id of *unknown_class*: `UNCLASSIFIED_ID`
+    for "Non_classifie" (the default, as in the existing labels), the index of
+    a class name, or -1 for None, meaning the feature is left out of the labels.
+
+    The lookup is compiled once: tags are resolved with a single
+    `pd.Index.get_indexer` and an array take, however many features there are.
+
+    Args:
+        tag_to_category (Mapping[str, str]): Category of each OSM building tag.
+        class_names (Sequence[str]): Class names, in the order of the class ids.
+        tag_ids (Mapping[str, int] | None, optional): Class id of OSM building tags.
+            Defaults to `CLASS_IDS`; None derives them from the categories.
+        unknown_class (str | None, optional): Class of the tags without class id.
+            Defaults to "Non_classifie" (id `UNCLASSIFIED_ID`).
+
+    Raises:
+        ValueError: If *unknown_class* is neither "Non_classifie", None nor one of the class names.
+    """
+
+    def __init__(
+        self,
+        tag_to_category: Mapping[str, str],
+        class_names: Sequence[str],
+        tag_ids: Mapping[str, int] | None = CLASS_IDS,
+        unknown_class: str | None = UNCLASSIFIED,
+    ) -> None:
+        self.tag_to_category = dict(tag_to_category)
+        self.class_names = list(class_names)
+        self.class_ids = {name.lower(): i for i, name in enumerate(self.class_names)}
+        if unknown_class is None:
+            self.unknown_id = -1
+        elif unknown_class == UNCLASSIFIED:
+            self.unknown_id = UNCLASSIFIED_ID
+        elif unknown_class.lower() in self.class_ids:
+            self.unknown_id = self.class_ids[unknown_class.lower()]
+        else:
+            raise ValueError(
+                f"Unknown class {unknown_class!r}, expected {UNCLASSIFIED!r}, None or one of {self.class_names}."
+            )
+
+        if tag_ids is None:
+            tag_ids = {
+                tag: self.class_ids[category.lower()]
+                for tag, category in self.tag_to_category.items()
+                if category.lower() in self.class_ids
+            }
+        self.tag_ids = dict(tag_ids)
+
+        # get_indexer returns -1 for unmapped tags, i.e. the last entry of the tables
+        self._tags = pd.Index(list(self.tag_to_category))
+        self._category_lookup = np.array(list(self.tag_to_category.values()) + [UNCLASSIFIED], dtype=object)
+        self._id_tags = pd.Index(list(self.tag_ids))
+        self._id_lookup = np.array(list(self.tag_ids.values()) + [self.unknown_id], dtype=np.int64)
+
+    @classmethod
+    def from_files(
+        cls,
+        mapping_file: str | Path = MAPPING_FILE,
+        data_yaml: str | Path = DATA_YAML,
+        tag_ids: Mapping[str, int] | None = CLASS_IDS,
+        unknown_class: str | None = UNCLASSIFIED,
+    ) -> "ClassMapping":
+        """Load the tag mapping from its JSON file and the class names from the dataset's data.yaml.
+
+        Args:
+            mapping_file (str | Path, optional): JSON mapping of OSM building tags to categories.
+                Defaults to the one of the project.
+            data_yaml (str | Path, optional): YOLO dataset configuration with the class `names`.
+                Defaults to the one of the project.
+            tag_ids (Mapping[str, int] | None, optional): Class id of OSM building tags.
+                Defaults to `CLASS_IDS`; None derives them from the categories.
+            unknown_class (str | None, optional): Class of the tags without class id.
+                Defaults to "Non_classifie".
+
+        Returns:
+            ClassMapping: the mapping.
+        """
+        with open(mapping_file, "r") as f:
+            tag_to_category = json.load(f)
+        with open(data_yaml, "r") as f:
+            class_names = yaml.safe_load(f)["names"]
+        if isinstance(class_names, dict):  # {id: name} form of data.yaml
+            class_names = [class_names[i] for i in sorted(class_names)]
+        return cls(tag_to_category, class_names, tag_ids, unknown_class)
+
+    @property
+    def nc(self) -> int:
+        """Number of classes."""
+        return len(self.class_names)
+
+    def categories(self, tags: Sequence[str] | np.ndarray | pd.Series) -> np.ndarray:
+        """Category of every tag, "Non_classifie" for unmapped ones."""
+        return self._category_lookup[self._tags.get_indexer(np.asarray(tags, dtype=object))]
+
+    def class_ids_of(self, tags: Sequence[str] | np.ndarray | pd.Series) -> np.ndarray:
+        """Class id of every tag, `unknown_id` for the tags without one."""
+        return self._id_lookup[self._id_tags.get_indexer(np.asarray(tags, dtype=object))]
+
+
+@lru_cache(maxsize=None)
+def load_class_mapping(
+    mapping_file: str | Path = MAPPING_FILE,
+    data_yaml: str | Path = DATA_YAML,
+    unknown_class: str | None = UNCLASSIFIED,
+) -> ClassMapping:
+    """Shared `ClassMapping` of the given files, loaded once per process.
+
+    Use it wherever class ids or names are needed (labelling, training,
+    evaluation) so that they all agree with the dataset.
+    """
+    return ClassMapping.from_files(mapping_file, data_yaml, unknown_class=unknown_class)
@@ -1,43 +1,54 @@
 """Provides functionality to clean overlapping bounding boxes in a GeoDataFrame."""
 
+import math
+from collections import defaultdict
+
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 from shapely.geometry import MultiPolygon, Polygon
 
+from miscellaneous.merge_axis_aligned_boxes import merge_axis_aligned_boxes
 
-def clean_overlapping_bboxes(
-    gdf: gpd.GeoDataFrame,
-    threshold: float = 0.3,
-) -> gpd.GeoDataFrame:
-    """Perform a single pass of overlap-based merging on a GeoDataFrame of polygons.
+ENGINES = ("loop", "strtree", "numpy")
+STABLE_ENGINES = ("grid", "numpy")
 
-    For each polygon, check if it intersects with another polygon. If the
-    intersection area represents more than *threshold* percent of the polygon's
-    own area, the two shapes are merged (union + envelope).
 
-    Only **one pass** is performed: the function scans all polygons once and
-    merges the first overlapping pair it finds for each polygon.  Call this
-    function repeatedly until the result stabilises to fully clean the data.
+def _check_geometries(gdf: gpd.GeoDataFrame) -> None:
+    """Raise a ValueError if any geometry is not a Polygon or MultiPolygon."""
+    for geom in gdf.geometry:
+        if not isinstance(geom, (Polygon, MultiPolygon)):
+            raise ValueError("Geometry must be a Polygon or MultiPolygon")
 
-    Args:
-        gdf (gpd.GeoDataFrame): GeoDataFrame containing the bounding boxes.
-        threshold (float, optional): If intersection_area / polygon_area
-            exceeds this value the pair is merged. Defaults to 0.3.
 
-    Raises:
-        ValueError: If any geometry is not a Polygon or MultiPolygon.
+def _drop_degenerate(gdf: gpd.GeoDataFrame) -> tuple[gpd.GeoDataFrame, bool]:
+    """Remove the empty and zero-area geometries, which every merging pass drops anyway.
+
+    Their NaN or flat bounds must not reach the grid index nor the box check
+    of the "numpy" engine.
 
     Returns:
-        gpd.GeoDataFrame: GeoDataFrame after one merging pass.
+        tuple[gpd.GeoDataFrame, bool]: the remaining rows, re-indexed, and whether any was removed.
     """
-    gdf = gdf.copy().reset_index(drop=True)
+    keep = shapely.area(gdf.geometry.to_numpy()) > 0
+    if keep.all():
+        return gdf, False
+    return gdf[keep].reset_index(drop=True), True
 
-    for geom in gdf.geometry:
-        if not isinstance(geom, (Polygon, MultiPolygon)):
-            raise ValueError("Geometry must be a Polygon or MultiPolygon")
 
+def _find_merges_loop(
+    gdf: gpd.GeoDataFrame,
+    threshold: float,
+) -> tuple[list[tuple[int, int]], set[int]]:
+    """Reference O(n²) scan: compare every polygon with every later polygon.
+
+    Returns:
+        tuple[list[tuple[int, int]], set[int]]: merged pairs (idx_a, idx_b) in
+            scan order, and every index that must be removed from the output.
+    """
     merged_indices: set[int] = set()
-    new_rows: list[dict] = []
+    merges: list[tuple[int, int]] = []
 
     for idx_a in gdf.index:
         if idx_a in merged_indices:
@@ -48,8 +59,6 @@ def clean_overlapping_bboxes(
             merged_indices.add(idx_a)
             continue
 
-        merge_target: int | None = None
-
         for idx_b in gdf.index:
             if idx_b <= idx_a or idx_b in merged_indices:
                 continue
@@ -65,38 +74,352 @@ def clean_overlapping_bboxes(
             ratio_b = inter_area / geom_b.area
 
             if ratio_a > threshold or ratio_b > threshold:
-                merge_target = idx_b
+                merges.append((idx_a, idx_b))
+                merged_indices.add(idx_a)
+                merged_indices.add(idx_b)
                 break
 
-        if merge_target is not None:
-            geom_b = gdf.loc[merge_target, "geometry"]
-            merged_geom = geom_a.union(geom_b).envelope
+    return merges, merged_indices
 
-            # Keep metadata from the largest polygon
-            if geom_a.area >= geom_b.area:
-                larger_idx = idx_a
-            else:
-                larger_idx = merge_target
 
-            # Create new row with merged geometry and metadata from larger polygon
-            new_row = gdf.loc[larger_idx].to_dict()
-            new_row["geometry"] = merged_geom
-            new_rows.append(new_row)
+def _find_merges_strtree(
+    gdf: gpd.GeoDataFrame,
+    threshold: float,
+) -> tuple[list[tuple[int, int]], set[int]]:
+    """Same scan as `_find_merges_loop`, restricted to STRtree candidates.
 
-            merged_indices.add(idx_a)
-            merged_indices.add(merge_target)
-        # else: polygon stays as-is (handled below)
+    Only polygons whose envelopes intersect can have a non-zero intersection
+    area, so the tree query returns every pair the full scan could merge.
+    Candidates are visited in index order to keep the first-match semantics.
+    """
+    geoms = gdf.geometry.to_numpy()
+    areas = shapely.area(geoms)
+    tree = shapely.STRtree(geoms)
+
+    removed = np.zeros(len(geoms), dtype=bool)
+    merges: list[tuple[int, int]] = []
+
+    for idx_a in range(len(geoms)):
+        if removed[idx_a]:
+            continue
+
+        if areas[idx_a] == 0:
+            removed[idx_a] = True
+            continue
+
+        candidates = tree.query(geoms[idx_a])
+        candidates = np.sort(candidates[candidates > idx_a])
+        candidates = candidates[~removed[candidates] & (areas[candidates] > 0)]
+        if candidates.size == 0:
+            continue
+
+        inter_areas = shapely.area(shapely.intersection(geoms[idx_a], geoms[candidates]))
+        overlapping = (inter_areas / areas[idx_a] > threshold) | (
+            inter_areas / areas[candidates] > threshold
+        )
+        hits = np.flatnonzero(overlapping)
+        if hits.size:
+            idx_b = int(candidates[hits[0]])
+            merges.append((idx_a, idx_b))
+            removed[idx_a] = True
+            removed[idx_b] = True
+
+    return merges, set(np.flatnonzero(removed).tolist())
+
+
+def _axis_aligned_bounds(gdf: gpd.GeoDataFrame) -> np.ndarray:
+    """Return the (N, 4) bounds of *gdf*, checking every geometry is a box."""
+    geoms = gdf.geometry.to_numpy()
+    bounds = shapely.bounds(geoms)
+    box_areas = (bounds[:, 2] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 1])
+    if not np.allclose(shapely.area(geoms), box_areas, rtol=1e-9, atol=0):
+        raise ValueError(
+            'The "numpy" engine only handles axis-aligned boxes, '
+            "use the envelope of the geometries."
+        )
+    return bounds
+
+
+def _from_axis_aligned(
+    gdf: gpd.GeoDataFrame,
+    boxes: np.ndarray,
+    source: np.ndarray,
+) -> gpd.GeoDataFrame:
+    """Build the output of the "numpy" engine: rows of *source*, with *boxes* as geometry.
+
+    Boxes left untouched keep their original geometry object.
+    """
+    original = gdf.geometry.to_numpy()[source]
+    unchanged = np.all(boxes == shapely.bounds(original), axis=1)
+    geometry = np.where(unchanged, original, shapely.box(*boxes.T))
+
+    result = gdf.iloc[source].reset_index(drop=True)
+    result[gdf.geometry.name] = gpd.GeoSeries(geometry, crs=gdf.crs)
+    return result
+
+
+def _assemble_result(
+    gdf: gpd.GeoDataFrame,
+    merges: list[tuple[int, int]],
+    merged_indices: set[int],
+) -> gpd.GeoDataFrame:
+    """Build the output: un-merged polygons first, then one row per merged pair."""
+    new_rows: list[dict] = []
+    for idx_a, idx_b in merges:
+        geom_a = gdf.loc[idx_a, "geometry"]
+        geom_b = gdf.loc[idx_b, "geometry"]
+        merged_geom = geom_a.union(geom_b).envelope
+
+        # Keep metadata from the largest polygon
+        larger_idx = idx_a if geom_a.area >= geom_b.area else idx_b
+
+        # Create new row with merged geometry and metadata from larger polygon
+        new_row = gdf.loc[larger_idx].to_dict()
+        new_row["geometry"] = merged_geom
+        new_rows.append(new_row)
 
-    # Build result: keep un-merged polygons + add newly merged ones
     remaining = gdf.loc[~gdf.index.isin(merged_indices)]
     if new_rows:
         merged_gdf = gpd.GeoDataFrame(new_rows, crs=gdf.crs)
-        result = gpd.GeoDataFrame(
+        return gpd.GeoDataFrame(
             pd.concat([remaining, merged_gdf], ignore_index=True),
             geometry="geometry",
             crs=gdf.crs,
         )
+    return remaining.reset_index(drop=True)
+
+
+def clean_overlapping_bboxes(
+    gdf: gpd.GeoDataFrame,
+    threshold: float = 0.3,
+    engine: str = "strtree",
+) -> gpd.GeoDataFrame:
+    """Perform a single pass of overlap-based merging on a GeoDataFrame of polygons.
+
+    For each polygon, check if it intersects with another polygon. If the
+    intersection area represents more than *threshold* percent of the polygon's
+    own area, the two shapes are merged (union + envelope).
+
+    Only **one pass** is performed: the function scans all polygons once and
+    merges the first overlapping pair it finds for each polygon.  Use
+    `clean_overlapping_bboxes_until_stable` to fully clean the data.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame containing the bounding boxes.
+        threshold (float, optional): If intersection_area / polygon_area
+            exceeds this value the pair is merged. Defaults to 0.3.
+        engine (str, optional): "strtree" only tests pairs whose envelopes
+            intersect, using a shapely STRtree. "loop" compares every pair
+            (O(n²)) and is kept as a reference. "numpy" runs
+            `merge_axis_aligned_boxes` on the bounds and requires every
+            geometry to be an axis-aligned box (e.g. an envelope). All engines
+            give the same result. Defaults to "strtree".
+
+    Raises:
+        ValueError: If any geometry is not a Polygon or MultiPolygon.
+        ValueError: If the engine is unknown or the threshold is negative.
+        ValueError: If the "numpy" engine is given geometries that are not boxes.
+
+    Returns:
+        gpd.GeoDataFrame: GeoDataFrame after one merging pass.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}.")
+    if threshold < 0:
+        raise ValueError("Threshold must be positive.")
+
+    gdf = gdf.copy().reset_index(drop=True)
+    _check_geometries(gdf)
+
+    if engine == "numpy":
+        gdf, _ = _drop_degenerate(gdf)
+        boxes, source = merge_axis_aligned_boxes(_axis_aligned_bounds(gdf), threshold)
+        return _from_axis_aligned(gdf, boxes, source)
+
+    if engine == "loop":
+        merges, merged_indices = _find_merges_loop(gdf, threshold)
     else:
-        result = remaining.reset_index(drop=True)
+        merges, merged_indices = _find_merges_strtree(gdf, threshold)
 
-    return result
+    return _assemble_result(gdf, merges, merged_indices)
+
+
+class _GridIndex:
+    """Uniform grid hash over envelopes, supporting insertion and removal.
+
+    shapely's STRtree is immutable, so it would have to be rebuilt after every
+    merge. This grid is updated in place as boxes disappear and appear.
+    """
+
+    def __init__(self, cell_size: float) -> None:
+        self.cell_size = cell_size
+        self.cells: defaultdict[tuple[int, int], set[int]] = defaultdict(set)
+
+    def _cells(self, bounds: tuple[float, float, float, float]):
+        minx, miny, maxx, maxy = bounds
+        for cx in range(math.floor(minx / self.cell_size), math.floor(maxx / self.cell_size) + 1):
+            for cy in range(math.floor(miny / self.cell_size), math.floor(maxy / self.cell_size) + 1):
+                yield cx, cy
+
+    def insert(self, item: int, bounds: tuple[float, float, float, float]) -> None:
+        for cell in self._cells(bounds):
+            self.cells[cell].add(item)
+
+    def remove(self, item: int, bounds: tuple[float, float, float, float]) -> None:
+        for cell in self._cells(bounds):
+            self.cells[cell].discard(item)
+
+    def query(self, bounds: tuple[float, float, float, float]) -> set[int]:
+        found: set[int] = set()
+        for cell in self._cells(bounds):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+
+def clean_overlapping_bboxes_until_stable(
+    gdf: gpd.GeoDataFrame,
+    threshold: float = 0.3,
+    max_passes: int | None = None,
+    engine: str = "grid",
+) -> tuple[gpd.GeoDataFrame, int]:
+    """Repeat the merging pass of `clean_overlapping_bboxes` until nothing changes.
+
+    The result is the same as calling `clean_overlapping_bboxes` in a loop until
+    the output stops changing, but the passes run on plain lists of geometries
+    with a grid index that is updated as boxes merge. The GeoDataFrame is built
+    only once, at the end.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame containing the bounding boxes.
+        threshold (float, optional): If intersection_area / polygon_area
+            exceeds this value the pair is merged. Defaults to 0.3.
+        max_passes (int | None, optional): Stop after this many passes even if
+            the result is not stable yet. Defaults to None (no limit).
+        engine (str, optional): "grid" works on any polygon. "numpy" repeats
+            `merge_axis_aligned_boxes` on the bounds and requires every
+            geometry to be an axis-aligned box. Defaults to "grid".
+
+    Raises:
+        ValueError: If any geometry is not a Polygon or MultiPolygon.
+        ValueError: If the engine is unknown or the threshold is negative.
+        ValueError: If the "numpy" engine is given geometries that are not boxes.
+
+    Returns:
+        tuple[gpd.GeoDataFrame, int]: the cleaned GeoDataFrame and the number of
+            passes that modified the data (0 if the input was already stable).
+    """
+    if engine not in STABLE_ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {STABLE_ENGINES}.")
+    if threshold < 0:
+        raise ValueError("Threshold must be positive.")
+
+    gdf = gdf.copy().reset_index(drop=True)
+    _check_geometries(gdf)
+    if max_passes == 0:
+        return gdf, 0
+    # dropping them is a change made by the first pass
+    gdf, dropped = _drop_degenerate(gdf)
+
+    if engine == "numpy":
+        result, n_passes = _until_stable_axis_aligned(gdf, threshold, max_passes)
+        return result, max(n_passes, int(dropped))
+
+    # One entry per box, merged boxes are appended; `source` points to the row
+    # of *gdf* holding the box's metadata.
+    geoms: list = list(gdf.geometry)
+    areas: list[float] = [geom.area for geom in geoms]
+    bounds: list[tuple[float, float, float, float]] = [geom.bounds for geom in geoms]
+    source: list[int] = list(range(len(geoms)))
+
+    sizes = [max(b[2] - b[0], b[3] - b[1]) for b in bounds]
+    sizes = [size for size in sizes if size > 0]
+    index = _GridIndex(cell_size=float(np.median(sizes)) if sizes else 1.0)
+    for item, item_bounds in enumerate(bounds):
+        index.insert(item, item_bounds)
+
+    order: list[int] = list(range(len(geoms)))
+    n_passes = 0
+    while max_passes is None or n_passes < max_passes:
+        position = {item: pos for pos, item in enumerate(order)}
+        removed: set[int] = set()
+        created: list[int] = []
+
+        for item_a in order:
+            if item_a in removed:
+                continue
+
+            if areas[item_a] == 0:
+                removed.add(item_a)
+                index.remove(item_a, bounds[item_a])
+                continue
+
+            candidates = sorted(
+                (
+                    item
+                    for item in index.query(bounds[item_a])
+                    if position.get(item, -1) > position[item_a]
+                    and item not in removed
+                    and areas[item] > 0
+                ),
+                key=position.__getitem__,
+            )
+            if not candidates:
+                continue
+
+            candidate_areas = np.array([areas[item] for item in candidates])
+            inter_areas = shapely.area(
+                shapely.intersection(geoms[item_a], [geoms[item] for item in candidates])
+            )
+            overlapping = (inter_areas / areas[item_a] > threshold) | (
+                inter_areas / candidate_areas > threshold
+            )
+            hits = np.flatnonzero(overlapping)
+            if hits.size == 0:
+                continue
+
+            item_b = candidates[hits[0]]
+            merged_geom = geoms[item_a].union(geoms[item_b]).envelope
+            larger = item_a if areas[item_a] >= areas[item_b] else item_b
+
+            geoms.append(merged_geom)
+            areas.append(merged_geom.area)
+            bounds.append(merged_geom.bounds)
+            source.append(source[larger])
+            created.append(len(geoms) - 1)
+
+            for item in (item_a, item_b):
+                removed.add(item)
+                index.remove(item, bounds[item])
+
+        if not removed:
+            break
+
+        # Merged boxes only take part from the next pass on, as new rows would.
+        for item in created:
+            index.insert(item, bounds[item])
+        order = [item for item in order if item not in removed] + created
+        n_passes += 1
+
+    result = gdf.iloc[[source[item] for item in order]].reset_index(drop=True)
+    result[gdf.geometry.name] = gpd.GeoSeries([geoms[item] for item in order], crs=gdf.crs)
+    return result, max(n_passes, int(dropped))
+
+
+def _until_stable_axis_aligned(
+    gdf: gpd.GeoDataFrame,
+    threshold: float,
+    max_passes: int | None,
+) -> tuple[gpd.GeoDataFrame, int]:
+    """"numpy" engine of `clean_overlapping_bboxes_until_stable`."""
+    boxes = _axis_aligned_bounds(gdf)
+    source = np.arange(len(boxes))
+
+    n_passes = 0
+    while max_passes is None or n_passes < max_passes:
+        new_boxes, new_source = merge_axis_aligned_boxes(boxes, threshold)
+        if len(new_boxes) == len(boxes):
+            break
+        boxes, source = new_boxes, source[new_source]
+        n_passes += 1
+
+    return _from_axis_aligned(gdf, boxes, source), n_passes
@@ -0,0 +1,171 @@
+"""Clean the overlapping bounding boxes of many tiles in parallel processes."""
+
+import os
+import re
+from collections.abc import Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import geopandas as gpd
+
+from miscellaneous.clean_overlapping_bboxes import (
+    clean_overlapping_bboxes,
+    clean_overlapping_bboxes_until_stable,
+)
+from miscellaneous.cluster_overlapping_bboxes import cluster_overlapping_bboxes
+from miscellaneous.feature_cache import FeatureCache, read_cached_features
+from miscellaneous.format_yolo_labels import write_yolo_labels
+
+METHODS = ("single_pass", "until_stable", "cluster")
+_FEATURES_FILE = re.compile(r"features_(.+)\.geojson")
+
+# Columns of the cached features read for cleaning and labelling
+_CACHED_COLUMNS = ("building", "category_of_building")
+
+# (tile id, GeoDataFrame or path to a GeoJSON or cached GeoParquet file, image bbox or None)
+_Task = tuple[str, gpd.GeoDataFrame | Path, tuple[float, float, float, float] | None]
+
+
+def _clean_tile(
+    tile_id: str,
+    features: gpd.GeoDataFrame | Path,
+    bbox: tuple[float, float, float, float] | None,
+    output_dir: Path,
+    threshold: float,
+    method: str,
+) -> int:
+    """Clean the features of one tile and write them, with YOLO labels if *bbox* is set.
+
+    Returns:
+        int: number of bounding boxes after cleaning.
+    """
+    if isinstance(features, Path):
+        if features.suffix == ".parquet":
+            features = read_cached_features(features, _CACHED_COLUMNS)
+        else:
+            features = gpd.read_file(features)
+
+    gdf_bbox = features[features.geometry.type.isin(["Polygon", "MultiPolygon"])].copy()
+    gdf_bbox["geometry"] = gdf_bbox["geometry"].envelope
+
+    if method == "single_pass":
+        gdf_cleaned = clean_overlapping_bboxes(gdf_bbox, threshold=threshold)
+    elif method == "until_stable":
+        gdf_cleaned, _ = clean_overlapping_bboxes_until_stable(gdf_bbox, threshold=threshold)
+    else:
+        gdf_cleaned = cluster_overlapping_bboxes(gdf_bbox, threshold=threshold)
+
+    cleaned_file = output_dir / f"cleaned_features_{tile_id}.geojson"
+    if len(gdf_cleaned):
+        gdf_cleaned.to_file(cleaned_file, driver="GeoJSON")
+    else:
+        # no box left: the file of a previous run would no longer match the labels
+        cleaned_file.unlink(missing_ok=True)
+
+    if bbox is not None:
+        write_yolo_labels(gdf_cleaned, bbox, output_dir / f"image_{tile_id}.txt")
+
+    return len(gdf_cleaned)
+
+
+def _clean_chunk(
+    tasks: list[_Task],
+    output_dir: Path,
+    threshold: float,
+    method: str,
+) -> dict[str, int]:
+    """Clean a chunk of tiles inside one worker process."""
+    return {
+        tile_id: _clean_tile(tile_id, features, bbox, output_dir, threshold, method)
+        for tile_id, features, bbox in tasks
+    }
+
+
+def clean_overlapping_bboxes_many(
+    tiles: str | Path | Sequence[gpd.GeoDataFrame] | FeatureCache,
+    output_dir: str | Path = "data/cleaned_polygons",
+    tile_bboxes: Mapping[str, tuple[float, float, float, float]] | None = None,
+    threshold: float = 0.3,
+    method: str = "single_pass",
+    max_workers: int | None = None,
+    chunk_size: int = 8,
+) -> dict[str, int]:
+    """Clean the bounding boxes of many tiles over a pool of processes.
+
+    Each tile goes through the same steps as in the pipeline notebook: keep the
+    polygons, take their envelopes, clean the overlaps, then write
+    `cleaned_features_{tile_id}.geojson` (removed if no box is left) and, when
+    the tile's image bbox is known, the YOLO labels `image_{tile_id}.txt` in
+    *output_dir*.
+
+    Tiles are sent to the workers in chunks of *chunk_size*, with at most two
+    chunks per worker in flight at once.
+
+    Args:
+        tiles (str | Path | Sequence[gpd.GeoDataFrame] | FeatureCache): Directory
+            containing `features_{tile_id}.geojson` files (e.g. data/raw_polygons),
+            a list of GeoDataFrames whose tile ids are their positions in the list,
+            or a `FeatureCache`, read for the tiles of *tile_bboxes* it holds (only
+            the columns needed, in the workers).
+        output_dir (str | Path, optional): Directory where cleaned features and
+            labels are written. Defaults to "data/cleaned_polygons".
+        tile_bboxes (Mapping[str, tuple] | None, optional): Image bbox
+            (west, south, east, north) of each tile id, used to write the YOLO
+            labels, e.g. `tile_bboxes_from_csv` of the coordinates CSV. Tiles
+            without bbox only get their cleaned features written. Defaults to None.
+        threshold (float, optional): Overlap threshold used for cleaning. Defaults to 0.3.
+        method (str, optional): "single_pass" (`clean_overlapping_bboxes`, as in
+            the notebook), "until_stable" (`clean_overlapping_bboxes_until_stable`)
+            or "cluster" (`cluster_overlapping_bboxes`). Defaults to "single_pass".
+        max_workers (int | None, optional): Number of worker processes.
+            Defaults to None (one per CPU).
+        chunk_size (int, optional): Number of tiles sent to a worker at once. Defaults to 8.
+
+    Raises:
+        ValueError: If the method is unknown, chunk_size is not positive, or
+            *tiles* is a `FeatureCache` without *tile_bboxes*.
+
+    Returns:
+        dict[str, int]: Number of bounding boxes left for each tile id.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}.")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+    if isinstance(tiles, FeatureCache) and not tile_bboxes:
+        raise ValueError("tile_bboxes are needed to read the tiles of a FeatureCache.")
+
+    tile_bboxes = tile_bboxes or {}
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    sources: list[tuple[str, gpd.GeoDataFrame | Path]] = []
+    if isinstance(tiles, FeatureCache):
+        sources = list(tiles.tile_paths(tile_bboxes).items())
+    elif isinstance(tiles, (str, Path)):
+        for path in sorted(Path(tiles).glob("features_*.geojson")):
+            sources.append((_FEATURES_FILE.fullmatch(path.name).group(1), path))
+    else:
+        sources = [(str(i), gdf) for i, gdf in enumerate(tiles)]
+
+    tasks: list[_Task] = [
+        (tile_id, features, tile_bboxes.get(tile_id)) for tile_id, features in sources
+    ]
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = 2 * max_workers
+
+    results: dict[str, int] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending: set[Future] = set()
+        for chunk in chunks:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results.update(future.result())
+            pending.add(executor.submit(_clean_chunk, chunk, output_dir, threshold, method))
+        for future in pending:
+            results.update(future.result())
+
+    return {tile_id: results[tile_id] for tile_id, _, _ in tasks}
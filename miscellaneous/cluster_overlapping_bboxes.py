@@ -0,0 +1,114 @@
+"""Merge overlapping bounding boxes by connected components of their overlap graph."""
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from miscellaneous.clean_overlapping_bboxes import _check_geometries
+
+
+def _find(parent: np.ndarray, item: int) -> int:
+    """Return the root of *item*, halving the path on the way."""
+    while parent[item] != item:
+        parent[item] = parent[parent[item]]
+        item = parent[item]
+    return item
+
+
+def _overlap_components(geoms: np.ndarray, areas: np.ndarray, threshold: float) -> np.ndarray:
+    """Label the connected components of the overlap graph with union-find.
+
+    Edges link two geometries when their intersection area exceeds *threshold*
+    of either one's area. Candidate pairs come from a single STRtree query.
+
+    Returns:
+        np.ndarray: for each geometry, the smallest index of its component.
+    """
+    tree = shapely.STRtree(geoms)
+    left, right = tree.query(geoms, predicate="intersects")
+    keep = left < right
+    left, right = left[keep], right[keep]
+
+    inter_areas = shapely.area(shapely.intersection(geoms[left], geoms[right]))
+    overlapping = (inter_areas / areas[left] > threshold) | (inter_areas / areas[right] > threshold)
+
+    parent = np.arange(len(geoms))
+    for a, b in zip(left[overlapping], right[overlapping]):
+        root_a, root_b = _find(parent, a), _find(parent, b)
+        if root_a != root_b:
+            # The smallest index becomes the root so components keep input order
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return np.array([_find(parent, item) for item in range(len(geoms))], dtype=np.intp)
+
+
+def cluster_overlapping_bboxes(
+    gdf: gpd.GeoDataFrame,
+    threshold: float = 0.3,
+) -> gpd.GeoDataFrame:
+    """Merge every group of overlapping polygons into a single envelope.
+
+    Unlike `clean_overlapping_bboxes`, which merges one pair per polygon and
+    has to be run again until the result stabilises, the overlap graph (edges
+    where intersection_area / polygon_area exceeds *threshold*) is built once
+    and each connected component, found with union-find, becomes the envelope
+    of its members. Envelopes of components may overlap each other in turn, so
+    the grouping is repeated on them until no edge is left, which usually takes
+    one or two rounds.
+
+    Each output row keeps the metadata of the largest original polygon of its
+    component. Polygons with no area are dropped.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame containing the bounding boxes.
+        threshold (float, optional): If intersection_area / polygon_area
+            exceeds this value the pair is in the same component. Defaults to 0.3.
+
+    Raises:
+        ValueError: If any geometry is not a Polygon or MultiPolygon.
+        ValueError: If the threshold is negative.
+
+    Returns:
+        gpd.GeoDataFrame: One row per component, in the order of their first member.
+    """
+    if threshold < 0:
+        raise ValueError("Threshold must be positive.")
+
+    gdf = gdf.copy().reset_index(drop=True)
+    _check_geometries(gdf)
+
+    geoms = gdf.geometry.to_numpy()
+    areas = shapely.area(geoms)
+    keep = np.flatnonzero(areas > 0)
+    geoms, areas = geoms[keep], areas[keep]
+
+    # Row of *gdf* holding the metadata of each item, and its area
+    source = keep
+    source_areas = areas.copy()
+
+    while len(geoms):
+        roots = _overlap_components(geoms, areas, threshold)
+        components, labels = np.unique(roots, return_inverse=True)
+        if len(components) == len(geoms):
+            break
+
+        bounds = shapely.bounds(geoms)
+        merged = np.full((len(components), 4), [np.inf, np.inf, -np.inf, -np.inf])
+        np.minimum.at(merged[:, 0], labels, bounds[:, 0])
+        np.minimum.at(merged[:, 1], labels, bounds[:, 1])
+        np.maximum.at(merged[:, 2], labels, bounds[:, 2])
+        np.maximum.at(merged[:, 3], labels, bounds[:, 3])
+
+        # Largest member of each component, first member on ties
+        order = np.lexsort((np.arange(len(geoms)), -source_areas, labels))
+        largest = order[np.searchsorted(labels[order], np.arange(len(components)))]
+
+        sizes = np.bincount(labels)
+        geoms = np.where(sizes > 1, shapely.box(*merged.T), geoms[components])
+        areas = shapely.area(geoms)
+        source = source[largest]
+        source_areas = source_areas[largest]
+
+    result = gdf.iloc[source].reset_index(drop=True)
+    result[gdf.geometry.name] = gpd.GeoSeries(geoms, crs=gdf.crs)
+    return result
@@ -1,5 +1,5 @@
 """Utily function to create a bounding box from city coordinates."""
-from pyproj import Transformer
+from miscellaneous.get_transformer import get_transformer
 
 def create_bbox_from_city_coordinates(
         lat: float,
@@ -22,8 +22,8 @@ def create_bbox_from_city_coordinates(
     half_size_m_y = (height * 1000) / 2
 
     # reprojection WGS84 -> Lambert 93
-    to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
-    to_wgs84 = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
+    to_l93 = get_transformer("EPSG:4326", "EPSG:2154")
+    to_wgs84 = get_transformer("EPSG:2154", "EPSG:4326")
 
     cx, cy = to_l93.transform(lon, lat)
     minx, miny = cx - half_size_m_x, cy - half_size_m_y
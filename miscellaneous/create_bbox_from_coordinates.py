@@ -1,5 +1,9 @@
 """Utility to create a bounding box from center coordinates, image size and pixel size."""
-from pyproj import Transformer
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+
+from miscellaneous.get_transformer import get_transformer
 
 def create_bbox_from_coordinates(
         lat: float,
@@ -24,8 +28,8 @@ def create_bbox_from_coordinates(
     half_size_m_y = (img_height * pixel_size) / 2
 
     # reprojection WGS84 -> Lambert 93
-    to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
-    to_wgs84 = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
+    to_l93 = get_transformer("EPSG:4326", "EPSG:2154")
+    to_wgs84 = get_transformer("EPSG:2154", "EPSG:4326")
 
     cx, cy = to_l93.transform(lon, lat)
     minx, miny = cx - half_size_m_x, cy - half_size_m_y
@@ -35,3 +39,56 @@ def create_bbox_from_coordinates(
     east, north = to_wgs84.transform(maxx, maxy)
 
     return {"west": west, "south": south, "east": east, "north": north}
+
+
+def create_bboxes_from_coordinates(
+        lats: ArrayLike,
+        lons: ArrayLike,
+        img_height: int = 512 + 30,
+        img_width: int = 512,
+        pixel_size: float = 0.4) -> pd.DataFrame:
+    """Creates the bounding boxes (west, south, east, north) in lat/lon
+    of many center coordinates at once.
+
+    Same result as calling `create_bbox_from_coordinates` on every point, but
+    all points go through a single reprojection call each way.
+
+    Args:
+        lats (ArrayLike): latitudes of the center points.
+        lons (ArrayLike): longitudes of the center points.
+        img_height (int): height of the image in pixels. Default is 512px + 30px watermark.
+        img_width (int): width of the image in pixels. Default is 512px.
+        pixel_size (float): size of a pixel in meters. Default is 0.4m.
+
+    Raises:
+        ValueError: If lats and lons do not have the same shape.
+
+    Returns:
+        pd.DataFrame: one row per point with columns west, south, east, north.
+    """
+    lats = np.asarray(lats, dtype=np.float64).ravel()
+    lons = np.asarray(lons, dtype=np.float64).ravel()
+    if lats.shape != lons.shape:
+        raise ValueError("lats and lons must have the same shape.")
+
+    half_size_m_x = (img_width * pixel_size) / 2
+    half_size_m_y = (img_height * pixel_size) / 2
+
+    # reprojection WGS84 -> Lambert 93
+    to_l93 = get_transformer("EPSG:4326", "EPSG:2154")
+    to_wgs84 = get_transformer("EPSG:2154", "EPSG:4326")
+
+    cx, cy = to_l93.transform(lons, lats)
+
+    # both corners of every box in one call: (minx, miny) then (maxx, maxy)
+    corners_x = np.concatenate((cx - half_size_m_x, cx + half_size_m_x))
+    corners_y = np.concatenate((cy - half_size_m_y, cy + half_size_m_y))
+    corners_lon, corners_lat = to_wgs84.transform(corners_x, corners_y)
+
+    n = len(lats)
+    return pd.DataFrame({
+        "west": corners_lon[:n],
+        "south": corners_lat[:n],
+        "east": corners_lon[n:],
+        "north": corners_lat[n:],
+    })
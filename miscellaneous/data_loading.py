@@ -0,0 +1,256 @@
+"""YOLO training dataset and multi-worker DataLoaders, with reproducible worker seeding.
+
+Benchmark the loading throughput for each number of workers:
+
+    python -m miscellaneous.data_loading --workers 0 1 2 4
+"""
+
+import os
+import random
+import time
+from collections.abc import Callable, Iterable, Sequence
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from miscellaneous.label_index import LabelIndex, image_id_of, label_path_of, read_yolo_labels
+
+
+class YoloDetectionDataset(Dataset):
+    """
+    Dataset personnalisé pour YOLOv5.
+    Charge les images et les labels au format YOLO (class_id x y w h).
+    Augmentation : flip horizontal + flip vertical (pertinent pour imagerie satellite).
+
+    Defined at module level so that DataLoader workers can import it, which
+    a class defined in a notebook does not allow with the "spawn" start
+    method (Windows, macOS).
+
+    With a `LabelIndex`, targets are read from it instead of parsing the
+    label file of every sample at every epoch.
+    """
+
+    def __init__(
+        self,
+        image_paths: Sequence[str],
+        label_dir: str | Path,
+        img_size: int = 640,
+        augment: bool = False,
+        label_index: LabelIndex | None = None,
+    ) -> None:
+        self.image_paths = image_paths
+        self.label_dir = label_dir
+        self.img_size = img_size
+        self.augment = augment
+        self.label_index = label_index
+
+    def __len__(self) -> int:
+        return len(self.image_paths)
+
+    def __getitem__(self, idx: int) -> tuple[torch.Tensor, torch.Tensor]:
+        img_path = self.image_paths[idx]
+
+        try:
+            img = Image.open(img_path).convert('RGB')
+        except Exception as e:
+            print(f"Erreur chargement image {img_path}: {e}")
+            return torch.zeros((3, self.img_size, self.img_size)), torch.zeros((0, 5))
+
+        img = img.resize((self.img_size, self.img_size))
+        img_np = np.array(img)
+        if self.label_index is not None:
+            targets = self.label_index.targets(image_id_of(img_path)).copy()
+        else:
+            targets = read_yolo_labels(label_path_of(img_path, self.label_dir))
+
+        # Augmentation géométrique (flip H + flip V, prob 0.5 chacun)
+        # Pertinent pour l'imagerie satellite : pas d'orientation préférentielle
+        if self.augment:
+            if random.random() < 0.5:  # Flip horizontal
+                img_np = np.fliplr(img_np).copy()
+                targets[:, 1] = 1.0 - targets[:, 1]
+            if random.random() < 0.5:  # Flip vertical
+                img_np = np.flipud(img_np).copy()
+                targets[:, 2] = 1.0 - targets[:, 2]
+
+        img_tensor = torch.from_numpy(img_np).permute(2, 0, 1).float() / 255.0
+        return img_tensor, torch.from_numpy(targets)
+
+
+def yolo_collate_fn(batch: list[tuple[torch.Tensor, torch.Tensor]]) -> tuple[torch.Tensor, torch.Tensor]:
+    """Gère un batch d'images et de targets de tailles variables.
+
+    Returns:
+        tuple[torch.Tensor, torch.Tensor]: stacked images, and (M, 6) targets
+            [img_idx, class_id, x, y, w, h] of the whole batch.
+    """
+    imgs, targets = list(zip(*batch))
+    new_targets = []
+    for i, t in enumerate(targets):
+        if t.numel() > 0:
+            img_idx = torch.full((t.shape[0], 1), i, dtype=t.dtype)
+            new_targets.append(torch.cat((img_idx, t), 1))
+
+    if new_targets:
+        targets = torch.cat(new_targets, 0)
+    else:
+        targets = torch.zeros((0, 6))
+
+    return torch.stack(imgs), targets
+
+
+def seed_worker(worker_id: int) -> None:
+    """Seed `random` and NumPy in a DataLoader worker from the seed torch gave it.
+
+    Each worker gets the loader's base seed + its id, so augmentations are
+    the same from one run to another for a given number of workers.
+    """
+    worker_seed = torch.initial_seed() % 2**32
+    np.random.seed(worker_seed)
+    random.seed(worker_seed)
+
+
+def make_data_loader(
+    dataset: Dataset,
+    batch_size: int,
+    shuffle: bool = False,
+    sampler: Sampler | None = None,
+    num_workers: int = 0,
+    pin_memory: bool | None = None,
+    persistent_workers: bool = True,
+    prefetch_factor: int = 2,
+    seed: int | None = None,
+    collate_fn: Callable = yolo_collate_fn,
+) -> DataLoader:
+    """DataLoader loading batches in *num_workers* processes, reproducibly.
+
+    The base seed of the workers is drawn from a generator seeded with
+    *seed*, or from the global torch RNG (seeded by `set_seed`) if None, so
+    the batches and their augmentations are the same at every run with the
+    same number of workers. With `num_workers=0`, loading runs in the main
+    process and the worker options are ignored.
+
+    Args:
+        dataset (Dataset): Dataset of (image, targets) samples.
+        batch_size (int): Number of samples per batch.
+        shuffle (bool, optional): Shuffle the samples at every epoch. Defaults to False.
+        sampler (Sampler | None, optional): Sampler of the indices, instead of *shuffle*.
+            Defaults to None.
+        num_workers (int, optional): Number of loading processes. Defaults to 0.
+        pin_memory (bool | None, optional): Return batches in page-locked memory, for
+            asynchronous copies to the GPU with `.to(device, non_blocking=True)`.
+            Defaults to None (when CUDA is available).
+        persistent_workers (bool, optional): Keep the workers alive between epochs.
+            Defaults to True.
+        prefetch_factor (int, optional): Number of batches loaded in advance by each
+            worker. Defaults to 2.
+        seed (int | None, optional): Seed of the shuffling and of the workers.
+            Defaults to None (drawn from the global torch RNG).
+        collate_fn (Callable, optional): Merges samples into a batch. Defaults to
+            `yolo_collate_fn`.
+
+    Raises:
+        ValueError: If *num_workers* is negative.
+
+    Returns:
+        DataLoader: the loader.
+    """
+    if num_workers < 0:
+        raise ValueError(f"num_workers must be positive or 0, got {num_workers}.")
+
+    generator = None
+    if seed is not None:
+        generator = torch.Generator()
+        generator.manual_seed(seed)
+
+    worker_options = {}
+    if num_workers > 0:
+        worker_options = {
+            "persistent_workers": persistent_workers,
+            "prefetch_factor": prefetch_factor,
+            "worker_init_fn": seed_worker,
+        }
+
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle if sampler is None else False,
+        sampler=sampler,
+        num_workers=num_workers,
+        collate_fn=collate_fn,
+        pin_memory=torch.cuda.is_available() if pin_memory is None else pin_memory,
+        generator=generator,
+        **worker_options,
+    )
+
+
+def benchmark_data_loader(
+    dataset: Dataset,
+    worker_counts: Iterable[int] = (0, 1, 2, 4),
+    batch_size: int = 8,
+    epochs: int = 3,
+    **loader_options,
+) -> dict[int, float]:
+    """Loading throughput of *dataset*, in samples per second, for each number of workers.
+
+    Each loader runs one epoch first, not timed, to start its workers.
+
+    Args:
+        dataset (Dataset): Dataset to load.
+        worker_counts (Iterable[int], optional): Numbers of workers to compare.
+            Defaults to (0, 1, 2, 4).
+        batch_size (int, optional): Number of samples per batch. Defaults to 8.
+        epochs (int, optional): Number of timed epochs. Defaults to 3.
+        **loader_options: Other arguments of `make_data_loader`.
+
+    Returns:
+        dict[int, float]: samples per second of each number of workers.
+    """
+    throughputs = {}
+    for num_workers in worker_counts:
+        loader = make_data_loader(dataset, batch_size, num_workers=num_workers, **loader_options)
+        for _ in loader:
+            pass
+        start = time.perf_counter()
+        for _ in range(epochs):
+            for _ in loader:
+                pass
+        throughputs[num_workers] = epochs * len(dataset) / (time.perf_counter() - start)
+        del loader
+    return throughputs
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Benchmark the loading of the training images.")
+    parser.add_argument("--data-dir", default="dataset/train", help="directory with images/ and labels/")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--img-size", type=int, default=640)
+    parser.add_argument("--augment", action="store_true")
+    parser.add_argument("--packed-dir", default=None, help="load the arrays of pack_yolo_dataset instead of the images")
+    args = parser.parse_args()
+
+    if args.packed_dir:
+        from miscellaneous.packed_dataset import PackedYoloDataset
+
+        dataset = PackedYoloDataset(args.packed_dir, augment=args.augment)
+    else:
+        images_dir = os.path.join(args.data_dir, "images")
+        image_paths = sorted(glob.glob(os.path.join(images_dir, "*.jpg")) + glob.glob(os.path.join(images_dir, "*.png")))
+        dataset = YoloDetectionDataset(
+            image_paths, os.path.join(args.data_dir, "labels"), img_size=args.img_size, augment=args.augment
+        )
+
+    print(f"{len(dataset)} images, batch size {args.batch_size}")
+    throughputs = benchmark_data_loader(
+        dataset, args.workers, batch_size=args.batch_size, epochs=args.epochs, seed=42
+    )
+    for num_workers, samples_per_second in throughputs.items():
+        print(f"num_workers={num_workers:<2} {samples_per_second:8.1f} samples/s")
@@ -0,0 +1,194 @@
+"""On-disk cache of OSM building features in GeoParquet, keyed by bbox and tag query."""
+
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Callable, Mapping, Sequence
+from pathlib import Path
+
+import geopandas as gpd
+
+from miscellaneous.class_mapping import ClassMapping, load_class_mapping
+
+_FetchBuildings = Callable[[tuple[float, float, float, float]], gpd.GeoDataFrame | None]
+
+# Columns kept from the OSM features, besides the (element, id) index
+COLUMNS = ("building", "category_of_building", "geometry")
+
+# Tag query of `fetch_osm_buildings`
+BUILDING_TAGS = {"building": True}
+
+
+def read_cached_features(path: str | Path, columns: Sequence[str] | None = None) -> gpd.GeoDataFrame:
+    """Features of a cache file, indexed by (element, id).
+
+    Args:
+        path (str | Path): GeoParquet file written by `FeatureCache.put`.
+        columns (Sequence[str] | None, optional): Columns to read, the geometry is
+            always read. Defaults to None (all).
+
+    Returns:
+        gpd.GeoDataFrame: the features, possibly empty.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(["element", "id", *columns, "geometry"]))
+    return gpd.read_parquet(path, columns=columns).set_index(["element", "id"])
+
+
+class FeatureCache:
+    """Stores the buildings of every queried bbox in a GeoParquet file.
+
+    Each query (bbox rounded to *precision* decimals, and tags) is hashed into
+    the name of its file, in a sharded directory (`ab/abcd….parquet`). Files
+    hold the osmnx (element, id) index as columns, the WKB geometry, and the
+    "building" and "category_of_building" columns, so that cleaning and
+    labelling can read only the columns they need. A bbox without building is
+    cached as an empty file, so it is not queried again either.
+
+    Hits and misses of `cached` return the same columns. Stages working tile
+    by tile read the cache with `get_tiles` or `tile_paths`, from the bbox of
+    each tile id.
+
+    Args:
+        cache_dir (str | Path): Directory holding the files.
+        class_mapping (ClassMapping | None, optional): Mapping of the OSM building tags,
+            used to fill "category_of_building". Defaults to None (the mapping of the
+            project, see `load_class_mapping`).
+        precision (int, optional): Number of decimals the bbox coordinates are
+            rounded to before hashing. Defaults to 7 (about 1cm).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        class_mapping: ClassMapping | None = None,
+        precision: int = 7,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.class_mapping = class_mapping or load_class_mapping()
+        self.precision = precision
+
+    def key(self, bbox: tuple[float, float, float, float], tags: Mapping[str, object]) -> str:
+        """Hexadecimal SHA-256 of a (west, south, east, north) bbox and a tag query."""
+        canonical = json.dumps(
+            {"bbox": [round(float(side), self.precision) for side in bbox], "tags": tags},
+            sort_keys=True,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def path(self, bbox: tuple[float, float, float, float], tags: Mapping[str, object]) -> Path:
+        """File of a query, whether it is cached or not."""
+        key = self.key(bbox, tags)
+        return self.cache_dir / key[:2] / f"{key}.parquet"
+
+    def get(
+        self,
+        bbox: tuple[float, float, float, float],
+        tags: Mapping[str, object] = BUILDING_TAGS,
+        columns: Sequence[str] | None = None,
+    ) -> gpd.GeoDataFrame | None:
+        """Cached features of a query, None if the query is not cached.
+
+        Args:
+            bbox (tuple[float, float, float, float]): (west, south, east, north) bbox.
+            tags (Mapping[str, object], optional): osmnx tag query. Defaults to {"building": True}.
+            columns (Sequence[str] | None, optional): Columns to read, the geometry is
+                always read. Defaults to None (all).
+
+        Returns:
+            gpd.GeoDataFrame | None: the features indexed by (element, id), possibly empty.
+        """
+        path = self.path(bbox, tags)
+        if not path.exists():
+            return None
+        return read_cached_features(path, columns)
+
+    def tile_paths(
+        self,
+        tile_bboxes: Mapping[str, tuple[float, float, float, float]],
+        tags: Mapping[str, object] = BUILDING_TAGS,
+    ) -> dict[str, Path]:
+        """Files of the tiles whose (west, south, east, north) bbox is cached, by tile id."""
+        paths = {tile_id: self.path(bbox, tags) for tile_id, bbox in tile_bboxes.items()}
+        return {tile_id: path for tile_id, path in paths.items() if path.exists()}
+
+    def get_tiles(
+        self,
+        tile_bboxes: Mapping[str, tuple[float, float, float, float]],
+        tags: Mapping[str, object] = BUILDING_TAGS,
+        columns: Sequence[str] | None = None,
+    ) -> dict[str, gpd.GeoDataFrame]:
+        """Cached features of the tiles whose bbox is cached, by tile id.
+
+        Args:
+            tile_bboxes (Mapping[str, tuple]): (west, south, east, north) bbox of each tile id.
+            tags (Mapping[str, object], optional): osmnx tag query. Defaults to {"building": True}.
+            columns (Sequence[str] | None, optional): Columns to read, the geometry is
+                always read. Defaults to None (all).
+
+        Returns:
+            dict[str, gpd.GeoDataFrame]: the features of each cached tile, possibly empty.
+                Tiles not cached are left out.
+        """
+        return {
+            tile_id: read_cached_features(path, columns)
+            for tile_id, path in self.tile_paths(tile_bboxes, tags).items()
+        }
+
+    def _cached_columns(self, features: gpd.GeoDataFrame | None) -> gpd.GeoDataFrame:
+        """*features* reduced to the cached columns, with "element" and "id" as columns."""
+        if features is None:
+            return gpd.GeoDataFrame(
+                {"element": [], "id": [], "building": [], "category_of_building": []},
+                geometry=[],
+                crs=4326,
+            )
+        features = features.copy()
+        features["category_of_building"] = self.class_mapping.categories(features["building"])
+        return features[list(COLUMNS)].reset_index()
+
+    def put(
+        self,
+        bbox: tuple[float, float, float, float],
+        tags: Mapping[str, object],
+        features: gpd.GeoDataFrame | None,
+    ) -> None:
+        """Cache the osmnx *features* of a query; None caches an empty result."""
+        self._write(bbox, tags, self._cached_columns(features))
+
+    def _write(
+        self, bbox: tuple[float, float, float, float], tags: Mapping[str, object], features: gpd.GeoDataFrame
+    ) -> None:
+        """Write the cached columns of a query atomically."""
+        path = self.path(bbox, tags)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        features.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+
+    def cached(self, fetch_buildings: _FetchBuildings, tags: Mapping[str, object] = BUILDING_TAGS) -> _FetchBuildings:
+        """Wrap a `fetch_osm_buildings`-like function so that it reads the cache first.
+
+        Args:
+            fetch_buildings (Callable): Returns the buildings of a (west, south, east, north)
+                bbox, or None. Called on cache misses only.
+            tags (Mapping[str, object], optional): Tag query of *fetch_buildings*. Defaults to
+                {"building": True}.
+
+        Returns:
+            Callable: same signature, returning the cached columns, or None for bboxes
+                without building.
+        """
+
+        def fetch(bbox: tuple[float, float, float, float]) -> gpd.GeoDataFrame | None:
+            features = self.get(bbox, tags)
+            if features is None:
+                # misses return what the next hits will read
+                features = self._cached_columns(fetch_buildings(bbox))
+                self._write(bbox, tags, features)
+                features = features.set_index(["element", "id"])
+            return features if len(features) else None
+
+        return fetch
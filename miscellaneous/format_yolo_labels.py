@@ -1,45 +1,165 @@
+from collections.abc import Sequence
+from pathlib import Path
+
 import geopandas as gpd
+import numpy as np
+import shapely
+
+from miscellaneous.class_mapping import ClassMapping, load_class_mapping
+
+# one YOLO label: class_id x_center y_center width height
+YOLO_LINE_FORMAT = "%d %.6f %.6f %.6f %.6f"
+
+
+def _label_rows(geometries: np.ndarray, class_ids: np.ndarray, bboxes: np.ndarray) -> np.ndarray:
+    """(N, 5) array of YOLO labels of geometries, each in its (N, 4) or (1, 4) image bbox.
+
+    Features without class (id -1) are kept, callers filter them out.
+    """
+    minx, miny, maxx, maxy = shapely.bounds(geometries).T
+    img_minx, img_miny, img_maxx, img_maxy = bboxes.T
+    img_w = img_maxx - img_minx
+    img_h = img_maxy - img_miny
+
+    return np.column_stack((
+        class_ids,
+        ((minx + maxx) / 2 - img_minx) / img_w,
+        (img_maxy - (miny + maxy) / 2) / img_h,  # note the flip
+        (maxx - minx) / img_w,
+        (maxy - miny) / img_h,
+    ))
+
 
-CLASS_IDS = {
-    'house': 1,
-    'apartments': 2
-}
+def _format_rows(rows: np.ndarray) -> str:
+    """Format label rows with a single string operation, one line per row."""
+    if not len(rows):
+        return ""
+    return ((YOLO_LINE_FORMAT + "\n") * len(rows) % tuple(rows.ravel().tolist()))[:-1]
+
+
+def yolo_label_array(
+        gdf: gpd.GeoDataFrame,
+        bbox: tuple,
+        class_mapping: ClassMapping | None = None
+    ) -> np.ndarray:
+    """
+    Compute the YOLO labels of OSM features as an array.
+
+    Features whose building tag maps to class id -1 (see `ClassMapping`'s
+    *unknown_class*) are left out.
+
+    Args:
+        gdf (gpd.GeoDataFrame): OpenStreetMap features
+        bbox (tuple): Bounding box used for image
+        class_mapping (ClassMapping | None, optional): Tag to class id mapping.
+            Defaults to None (the mapping of the project, see `load_class_mapping`).
+
+    Returns:
+        np.ndarray: (N, 5) array of class_id, x_center, y_center, width, height
+    """
+    class_mapping = class_mapping or load_class_mapping()
+    rows = _label_rows(
+        np.asarray(gdf.geometry.values),
+        class_mapping.class_ids_of(gdf['building']),
+        np.asarray(bbox, dtype=np.float64).reshape(1, 4),
+    )
+    return rows[rows[:, 0] >= 0]
 
 
-def format_yolo_labels(gdf: gpd.GeoDataFrame, bbox: tuple) -> list[str]:
+def format_yolo_labels(
+        gdf: gpd.GeoDataFrame,
+        bbox: tuple,
+        class_mapping: ClassMapping | None = None
+    ) -> list[str]:
     """
     Convert a OSM features to YOLO format labels:
     ```txt
     class_id x_center y_center width height
     ```
 
+    Class ids are those of the dataset's data.yaml, see `ClassMapping`.
+
     Args:
         gdf (gpd.GeoDataFrame): OpenStreetMap features
         bbox (tuple): Bounding box used for image
+        class_mapping (ClassMapping | None, optional): Tag to class id mapping.
+            Defaults to None (the mapping of the project).
 
     Returns:
         str: YOLO formated labels
     """
-    img_minx, img_miny, img_maxx, img_maxy = bbox
-    img_w = img_maxx - img_minx
-    img_h = img_maxy - img_miny
+    text = _format_rows(yolo_label_array(gdf, bbox, class_mapping))
+    return text.split("\n") if text else []
 
-    bounds = gdf.bounds
-    gdf = gdf.join(bounds)
 
-    gdf['x_center'] = ((gdf['minx'] + gdf['maxx']) / 2 - img_minx) / img_w
-    gdf['y_center'] = (img_maxy - (gdf['miny'] + gdf['maxy']) / 2) / img_h  # note the flip
-    gdf['width'] = (gdf['maxx'] - gdf['minx']) / img_w
-    gdf['height'] = (gdf['maxy'] - gdf['miny']) / img_h
+def write_yolo_labels(
+        gdf: gpd.GeoDataFrame,
+        bbox: tuple,
+        output_file: str | Path,
+        class_mapping: ClassMapping | None = None
+    ) -> int:
+    """
+    Write the YOLO labels of OSM features to a label file, one line per feature.
 
-    gdf['class_id'] = gdf['building'].map(CLASS_IDS).fillna(0)
+    Args:
+        gdf (gpd.GeoDataFrame): OpenStreetMap features
+        bbox (tuple): Bounding box used for image
+        output_file (str | Path): Label file to write
+        class_mapping (ClassMapping | None, optional): Tag to class id mapping.
+            Defaults to None (the mapping of the project).
 
-    yolo_lines = (
-        gdf[['class_id', 'x_center', 'y_center', 'width', 'height']]
-        .apply(lambda r: f"{int(r.class_id)} {r.x_center:.6f} {r.y_center:.6f} "
-                         f"{r.width:.6f} {r.height:.6f}", axis=1)
-        .tolist()
-    )
+    Returns:
+        int: number of labels written
+    """
+    rows = yolo_label_array(gdf, bbox, class_mapping)
+    with open(output_file, "w") as f:
+        f.write(_format_rows(rows))
+    return len(rows)
 
-    return yolo_lines
 
+def write_yolo_labels_many(
+        gdfs: Sequence[gpd.GeoDataFrame],
+        bboxes: Sequence[tuple],
+        output_files: Sequence[str | Path],
+        class_mapping: ClassMapping | None = None
+    ) -> list[int]:
+    """
+    Write the YOLO labels of many tiles at once.
+
+    The labels of all tiles are computed in one pass over the concatenated
+    geometries, then each tile's rows are formatted and written to its file.
+
+    Args:
+        gdfs (Sequence[gpd.GeoDataFrame]): OpenStreetMap features of each tile
+        bboxes (Sequence[tuple]): Bounding box used for the image of each tile
+        output_files (Sequence[str | Path]): Label file of each tile
+        class_mapping (ClassMapping | None, optional): Tag to class id mapping.
+            Defaults to None (the mapping of the project).
+
+    Raises:
+        ValueError: If the three sequences do not have the same length.
+
+    Returns:
+        list[int]: number of labels written for each tile
+    """
+    if not len(gdfs) == len(bboxes) == len(output_files):
+        raise ValueError("gdfs, bboxes and output_files must have the same length.")
+    if not len(gdfs):
+        return []
+
+    class_mapping = class_mapping or load_class_mapping()
+    counts = np.array([len(gdf) for gdf in gdfs])
+    rows = _label_rows(
+        np.concatenate([np.asarray(gdf.geometry.values) for gdf in gdfs]),
+        class_mapping.class_ids_of(np.concatenate([gdf['building'].to_numpy(dtype=object) for gdf in gdfs])),
+        np.repeat(np.asarray(bboxes, dtype=np.float64).reshape(-1, 4), counts, axis=0),
+    )
+    keep = rows[:, 0] >= 0
+    counts = np.bincount(np.repeat(np.arange(len(gdfs)), counts)[keep], minlength=len(gdfs))
+    rows = rows[keep]
+
+    ends = np.cumsum(counts)
+    for output_file, start, end in zip(output_files, ends - counts, ends):
+        with open(output_file, "w") as f:
+            f.write(_format_rows(rows[start:end]))
+    return counts.tolist()
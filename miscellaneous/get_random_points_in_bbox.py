@@ -1,35 +1,345 @@
 """Generates random coordinates within a specified bounding box."""
-import random
+import math
+from collections.abc import Callable, Sequence
+
+import numpy as np
+
+from miscellaneous.get_transformer import get_transformer
+
+MODES = ("degrees", "metric", "poisson_disk", "jittered_grid")
+
+# Ground footprint of a 512px tile at 0.4m per pixel
+TILE_FOOTPRINT_M = 512 * 0.4
+
+# Points projected along each edge of a bbox to find its Lambert 93 extent
+_EDGE_POINTS = 17
+
+
+def _duplicated_rows(values: np.ndarray) -> np.ndarray:
+    """Boolean mask of the rows of a 2D array already seen earlier in the array."""
+    _, first = np.unique(values, axis=0, return_index=True)
+    duplicated = np.ones(len(values), dtype=bool)
+    duplicated[first] = False
+    return duplicated
+
+
+def _uniform_distinct(
+        rng: np.random.Generator,
+        low: np.ndarray,
+        high: np.ndarray,
+        number_of_points: int,
+        accept: Callable[[np.ndarray], np.ndarray] | None = None
+    ) -> np.ndarray:
+    """Draws points uniformly in (K, 1, 2) boxes [low, high], all distinct within a box.
+
+    With *accept*, a function of the (K, number_of_points, 2) points returning a
+    (K, number_of_points) mask, the points it rejects are drawn again.
+
+    Returns:
+        np.ndarray: (K, number_of_points, 2) array.
+    """
+    if number_of_points > 1 and np.any(np.all(low == high, axis=-1)):
+        raise ValueError("Cannot draw distinct points in a bounding box reduced to a point.")
+
+    points = rng.uniform(low, high, size=(len(low), number_of_points, 2))
+
+    # verify no duplicates within a bounding box, nor rejected points, redraw the ones found
+    box_ids = np.repeat(np.arange(len(low)), number_of_points).astype(np.float64)
+    while True:
+        flat = points.reshape(-1, 2)
+        redraw = _duplicated_rows(np.column_stack((box_ids, flat)))
+        if accept is not None:
+            redraw |= ~accept(points).reshape(-1)
+        if not redraw.any():
+            return points
+        box_of_redrawn = box_ids[redraw].astype(np.intp)
+        flat[redraw] = rng.uniform(low[box_of_redrawn, 0], high[box_of_redrawn, 0])
+
+
+def _bbox_to_lambert93(bbox: dict[str, float]) -> tuple[float, float, float, float]:
+    """Extent in Lambert 93 of a bbox: (minx, miny, maxx, maxy) enclosing all of it.
+
+    The bbox is not a rectangle in Lambert 93: meridians converge and parallels
+    are arcs. Its four corners, and points along its edges for the arcs, are
+    projected, so the extent contains the whole bbox and a bit more around it;
+    see `_in_bboxes` to reject the points drawn outside.
+    """
+    to_l93 = get_transformer("EPSG:4326", "EPSG:2154")
+    steps = np.linspace(0.0, 1.0, _EDGE_POINTS)
+    lon = bbox["west"] + steps * (bbox["east"] - bbox["west"])
+    lat = bbox["south"] + steps * (bbox["north"] - bbox["south"])
+    edge_lon = np.concatenate((lon, lon, np.full_like(lat, bbox["west"]), np.full_like(lat, bbox["east"])))
+    edge_lat = np.concatenate((np.full_like(lon, bbox["south"]), np.full_like(lon, bbox["north"]), lat, lat))
+    x, y = to_l93.transform(edge_lon, edge_lat)
+    return float(np.min(x)), float(np.min(y)), float(np.max(x)), float(np.max(y))
+
+
+def _in_bboxes(points: np.ndarray, bboxes: Sequence[dict[str, float]]) -> np.ndarray:
+    """Whether each point of a (K, N, 2) array of Lambert 93 (x, y) falls in the lat/lon bbox k.
+
+    Returns:
+        np.ndarray: (K, N) boolean mask.
+    """
+    lat_lon = _lambert93_to_lat_lon(points.reshape(-1, 2)).reshape(points.shape)
+    low = np.array([[bbox["south"], bbox["west"]] for bbox in bboxes], dtype=np.float64).reshape(-1, 1, 2)
+    high = np.array([[bbox["north"], bbox["east"]] for bbox in bboxes], dtype=np.float64).reshape(-1, 1, 2)
+    return np.all((lat_lon >= low) & (lat_lon <= high), axis=-1)
+
+
+def _lambert93_to_lat_lon(points: np.ndarray) -> np.ndarray:
+    """Converts an (N, 2) array of Lambert 93 (x, y) to (latitude, longitude)."""
+    to_wgs84 = get_transformer("EPSG:2154", "EPSG:4326")
+    lon, lat = to_wgs84.transform(points[:, 0], points[:, 1])
+    return np.column_stack((lat, lon))
+
+
+def _poisson_disk(
+        rng: np.random.Generator,
+        extent: tuple[float, float, float, float],
+        number_of_points: int,
+        min_distance: float,
+        max_attempts: int,
+        accept: Callable[[np.ndarray], np.ndarray] | None = None
+    ) -> np.ndarray:
+    """Dart throwing: random points, rejected when closer than *min_distance* to an accepted one.
+
+    Candidates outside *accept*, a function of an (M, 2) array returning an
+    (M,) mask, are rejected too, and count as attempts.
+
+    The distance is the Chebyshev one (max of |dx| and |dy|), so square tiles of
+    side *min_distance* centered on the points never overlap. With grid cells of
+    side *min_distance*, a cell holds at most one point and a candidate only has
+    to be checked against the 3x3 cells around it.
+    """
+    minx, miny, maxx, maxy = extent
+    grid: dict[tuple[int, int], tuple[float, float]] = {}
+    accepted: list[tuple[float, float]] = []
+
+    attempts = 0
+    while len(accepted) < number_of_points and attempts < max_attempts:
+        batch = min(max(2 * (number_of_points - len(accepted)), 64), max_attempts - attempts)
+        candidates = rng.uniform((minx, miny), (maxx, maxy), size=(batch, 2))
+        if accept is not None:
+            candidates = candidates[accept(candidates)]
+        cells = np.floor(candidates / min_distance).astype(np.int64)
+        attempts += batch
+
+        for (x, y), (cx, cy) in zip(candidates.tolist(), cells.tolist()):
+            if (cx, cy) in grid:
+                continue
+            too_close = False
+            for nx in (cx - 1, cx, cx + 1):
+                for ny in (cy - 1, cy, cy + 1):
+                    neighbour = grid.get((nx, ny))
+                    if neighbour and abs(neighbour[0] - x) < min_distance and abs(neighbour[1] - y) < min_distance:
+                        too_close = True
+                        break
+                if too_close:
+                    break
+            if too_close:
+                continue
+            grid[(cx, cy)] = (x, y)
+            accepted.append((x, y))
+            if len(accepted) == number_of_points:
+                break
+
+    if len(accepted) < number_of_points:
+        raise ValueError(
+            f"Could only place {len(accepted)} of {number_of_points} points "
+            f"{min_distance}m apart in {max_attempts} attempts."
+        )
+    return np.array(accepted, dtype=np.float64).reshape(-1, 2)
+
+
+def _jittered_grid(
+        rng: np.random.Generator,
+        extent: tuple[float, float, float, float],
+        number_of_points: int,
+        min_distance: float,
+        accept: Callable[[np.ndarray], np.ndarray] | None = None,
+        max_rounds: int = 100
+    ) -> np.ndarray:
+    """Stratified sampling: one jittered point in each of *number_of_points* random grid cells.
+
+    The grid has roughly square cells and at least *number_of_points* cells.
+    Points stay *min_distance* / 2 away from their cell's edges, so points of
+    different cells are at least *min_distance* apart on one axis.
+
+    Points outside *accept*, a function of an (M, 2) array returning an (M,)
+    mask, are jittered again in their cell, up to *max_rounds* times; cells
+    still without an accepted point are replaced by other random cells.
+    """
+    minx, miny, maxx, maxy = extent
+    width, height = maxx - minx, maxy - miny
+    cell = math.sqrt(width * height / number_of_points)
+    n_cols = max(1, math.ceil(width / cell))
+    n_rows = max(1, math.ceil(height / cell))
+    cell_w, cell_h = width / n_cols, height / n_rows
+    if min(cell_w, cell_h) < min_distance:
+        raise ValueError(
+            f"Cannot place {number_of_points} points {min_distance}m apart on a grid "
+            f"over {width:.0f}m x {height:.0f}m."
+        )
+
+    # cells in random order: the first ones are jittered, the next ones replace those given up
+    cells = rng.permutation(n_cols * n_rows)
+    origins = np.column_stack((minx + cells % n_cols * cell_w, miny + cells // n_cols * cell_h))
+    margin = min_distance / 2
+    rounds = np.zeros(len(cells), dtype=np.int64)
+    accepted: list[np.ndarray] = []
+    pending = np.arange(number_of_points)
+    next_cell = number_of_points
+    while pending.size:
+        jitter = rng.uniform((margin, margin), (cell_w - margin, cell_h - margin), size=(len(pending), 2))
+        candidates = origins[pending] + jitter
+        inside = np.ones(len(pending), dtype=bool) if accept is None else accept(candidates)
+        accepted.append(candidates[inside])
+        rounds[pending] += 1
+        pending = pending[~inside]
+
+        given_up = rounds[pending] >= max_rounds
+        if given_up.any():
+            replacements = np.arange(next_cell, min(next_cell + np.count_nonzero(given_up), len(cells)))
+            next_cell += len(replacements)
+            pending = np.concatenate((pending[~given_up], replacements))
+
+    points = np.concatenate(accepted)
+    if len(points) < number_of_points:
+        raise ValueError(
+            f"Cannot place {number_of_points} points {min_distance}m apart on a grid "
+            f"over {width:.0f}m x {height:.0f}m inside the bounding box."
+        )
+    return points
+
+
+def sample_points_in_bboxes(
+        bboxes: Sequence[dict[str, float]],
+        number_of_points: int = 10,
+        seed: int | np.random.Generator | None = None,
+        mode: str = "degrees",
+        min_distance: float = TILE_FOOTPRINT_M,
+        max_attempts: int = 100_000
+    ) -> np.ndarray:
+    """Draws random coordinates (latitude, longitude) within several bounding boxes at once.
+
+    Modes:
+        - "degrees": uniform in latitude/longitude. All points are drawn with a
+          single call to the random generator.
+        - "metric": uniform in Lambert 93 metres, i.e. uniform on the ground.
+        - "poisson_disk": uniform in metres, but points are kept at least
+          *min_distance* apart on x or y so the tiles centered on them do not
+          overlap.
+        - "jittered_grid": one point per cell of a grid covering the bbox,
+          jittered inside its cell while keeping *min_distance* between points.
+
+    In every mode, each box gets exactly *number_of_points* distinct points, all
+    inside the box: the metric modes draw again the points of its Lambert 93
+    extent that fall outside.
+    Spacing is only enforced between points of the same bounding box.
+
+    Args:
+        bboxes (Sequence[dict[str, float]]): Bounding boxes with keys "south", "north", "west", and "east".
+        number_of_points (int, optional): Number of coordinates to generate per bounding box. Defaults to 10.
+        seed (int | np.random.Generator | None, optional): Seed or generator, for reproducible draws.
+            Defaults to None (fresh entropy).
+        mode (str, optional): Sampling mode, see above. Defaults to "degrees".
+        min_distance (float, optional): Minimum spacing in metres for "poisson_disk" and
+            "jittered_grid". Defaults to the footprint of a 512px tile at 0.4m per pixel.
+        max_attempts (int, optional): Maximum number of candidates drawn per bounding box
+            in "poisson_disk" mode. Defaults to 100 000.
+
+    Raises:
+        ValueError: If the mode is unknown.
+        ValueError: If a bounding box is reduced to a point and more than one point is asked.
+        ValueError: If the points cannot be placed *min_distance* apart.
+
+    Returns:
+        np.ndarray: (len(bboxes), number_of_points, 2) array of (latitude, longitude).
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}.")
+
+    rng = np.random.default_rng(seed)
+    if mode == "degrees":
+        low = np.array([[bbox["south"], bbox["west"]] for bbox in bboxes], dtype=np.float64).reshape(-1, 1, 2)
+        high = np.array([[bbox["north"], bbox["east"]] for bbox in bboxes], dtype=np.float64).reshape(-1, 1, 2)
+        return _uniform_distinct(rng, low, high, number_of_points)
+
+    # points are drawn in the Lambert 93 extent of each bbox, and drawn again if outside the bbox
+    extents = [_bbox_to_lambert93(bbox) for bbox in bboxes]
+    if mode == "metric":
+        extents_array = np.array(extents, dtype=np.float64).reshape(-1, 1, 4)
+        points = _uniform_distinct(
+            rng, extents_array[..., :2], extents_array[..., 2:], number_of_points,
+            accept=lambda points: _in_bboxes(points, bboxes),
+        )
+    elif mode == "poisson_disk":
+        points = np.stack([
+            _poisson_disk(
+                rng, extent, number_of_points, min_distance, max_attempts,
+                accept=lambda points, bbox=bbox: _in_bboxes(points[None], [bbox])[0],
+            )
+            for extent, bbox in zip(extents, bboxes)
+        ]).reshape(len(extents), number_of_points, 2)
+    else:
+        points = np.stack([
+            _jittered_grid(
+                rng, extent, number_of_points, min_distance,
+                accept=lambda points, bbox=bbox: _in_bboxes(points[None], [bbox])[0],
+            )
+            for extent, bbox in zip(extents, bboxes)
+        ]).reshape(len(extents), number_of_points, 2)
+
+    return _lambert93_to_lat_lon(points.reshape(-1, 2)).reshape(points.shape)
+
+
+def sample_points_in_bbox(
+        bbox: dict[str, float],
+        number_of_points: int = 10,
+        seed: int | np.random.Generator | None = None,
+        mode: str = "degrees",
+        min_distance: float = TILE_FOOTPRINT_M,
+        max_attempts: int = 100_000
+    ) -> np.ndarray:
+    """Draws random coordinates (latitude, longitude) within a given bounding box.
+
+    See `sample_points_in_bboxes` for the sampling modes.
+
+    Args:
+        bbox (dict[str, float]): Bounding box with keys "south", "north", "west", and "east".
+        number_of_points (int, optional): Number of coordinates to generate. Defaults to 10.
+        seed (int | np.random.Generator | None, optional): Seed or generator, for reproducible draws.
+            Defaults to None (fresh entropy).
+        mode (str, optional): "degrees", "metric", "poisson_disk" or "jittered_grid". Defaults to "degrees".
+        min_distance (float, optional): Minimum spacing in metres for "poisson_disk" and
+            "jittered_grid". Defaults to the footprint of a 512px tile at 0.4m per pixel.
+        max_attempts (int, optional): Maximum number of candidates drawn in "poisson_disk" mode.
+            Defaults to 100 000.
+
+    Returns:
+        np.ndarray: (number_of_points, 2) array of distinct (latitude, longitude).
+    """
+    return sample_points_in_bboxes([bbox], number_of_points, seed, mode, min_distance, max_attempts)[0]
+
 
 def get_random_points_in_bbox(
         bbox: dict[str, float],
-        number_of_points: int = 10
+        number_of_points: int = 10,
+        seed: int | np.random.Generator | None = None,
+        mode: str = "degrees"
     ) -> list[dict[str, float]]:
     """Generates a random list of coordinates (latitude, longitude) within a given bounding box.
 
     Args:
         bbox (dict[str, float]): Bounding box with keys "south", "north", "west", and "east".
         number_of_points (int, optional): Number of coordinates to generate. Defaults to 10.
+        seed (int | np.random.Generator | None, optional): Seed or generator, for reproducible draws.
+            Defaults to None (fresh entropy).
+        mode (str, optional): "degrees", "metric", "poisson_disk" (tiles do not overlap) or
+            "jittered_grid", see `sample_points_in_bboxes`. Defaults to "degrees".
 
     Returns:
         list[dict[str, float]]: List of generated coordinates (latitude, longitude).
     """
-    coords: list[dict[str, float]] = []
-    lat_min, lat_max = bbox["south"], bbox["north"]
-    lon_min, lon_max = bbox["west"], bbox["east"]
-
-    def generate_points() -> None:
-            # Generate coordinates
-        coords.extend([
-            {"lat": random.uniform(lat_min, lat_max), "lon": random.uniform(lon_min, lon_max)}
-            for _ in range(number_of_points)
-        ])
-
-    generate_points()
-    # verify no duplicates
-    unique_coords = { (coord["lat"], coord["lon"]) for coord in coords }
-    while len(unique_coords) < number_of_points:
-        generate_points()
-        unique_coords = { (coord["lat"], coord["lon"]) for coord in coords }
-
-    return coords
+    points = sample_points_in_bbox(bbox, number_of_points, seed, mode)
+    return [{"lat": lat, "lon": lon} for lat, lon in points.tolist()]
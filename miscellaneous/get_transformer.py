@@ -0,0 +1,33 @@
+"""Per-thread cache of pyproj transformers."""
+import threading
+
+from pyproj import Transformer
+
+_local = threading.local()
+
+
+def get_transformer(crs_from: str, crs_to: str, always_xy: bool = True) -> Transformer:
+    """Returns a cached transformer between two CRS.
+
+    Creating a Transformer queries the PROJ database, which takes a few
+    milliseconds. Transformers are created once per (crs_from, crs_to,
+    always_xy) and reused. pyproj transformers must not be shared between
+    threads, so every thread gets its own instances.
+
+    Args:
+        crs_from (str): source CRS, e.g. "EPSG:4326".
+        crs_to (str): target CRS, e.g. "EPSG:2154".
+        always_xy (bool): use (lon, lat) / (x, y) axis order. Default is True.
+
+    Returns:
+        Transformer: transformer from crs_from to crs_to.
+    """
+    cache: dict[tuple[str, str, bool], Transformer] | None = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+
+    key = (crs_from, crs_to, always_xy)
+    transformer = cache.get(key)
+    if transformer is None:
+        transformer = cache[key] = Transformer.from_crs(crs_from, crs_to, always_xy=always_xy)
+    return transformer
@@ -0,0 +1,190 @@
+"""Columnar index of the YOLO label files, parsed once and refreshed when the files change."""
+
+import json
+import os
+import threading
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+INDEX_FILENAME = "labels_index.parquet"
+
+# Columns of the index: label file stem, then the values of a YOLO label row
+COLUMNS = ("image", "class", "x", "y", "w", "h")
+
+# Schema metadata key holding the modification time of every indexed label file
+_MTIMES_KEY = b"label_mtimes"
+
+
+def label_path_of(image_path: str | Path, label_dir: str | Path) -> Path:
+    """YOLO label file of an image: same name with a .txt extension, in *label_dir*."""
+    label_filename = os.path.basename(image_path).replace('.jpg', '.txt').replace('.png', '.txt')
+    return Path(label_dir) / label_filename
+
+
+def read_yolo_labels(label_path: str | Path) -> np.ndarray:
+    """(N, 5) float32 array of a YOLO label file, empty if the file is missing or empty."""
+    label_path = Path(label_path)
+    if not label_path.exists() or label_path.stat().st_size == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    return np.loadtxt(label_path, ndmin=2).reshape(-1, 5).astype(np.float32)
+
+
+def image_id_of(path: str | Path) -> str:
+    """Id of an image or label file in the index: its name without extension."""
+    return Path(path).stem
+
+
+def _label_mtimes(label_dir: Path) -> dict[str, int]:
+    """Modification time, in ns, of each label file of *label_dir*, by image id."""
+    with os.scandir(label_dir) as entries:
+        return {
+            image_id_of(entry.name): entry.stat().st_mtime_ns
+            for entry in entries
+            if entry.name.endswith(".txt") and entry.is_file()
+        }
+
+
+def _parse_labels(label_dir: Path, image_ids: Iterable[str]) -> pd.DataFrame:
+    """Rows of the label files of *image_ids*, in the columns of the index."""
+    frames = []
+    for image_id in image_ids:
+        values = read_yolo_labels(label_dir / f"{image_id}.txt")
+        if len(values):
+            frame = pd.DataFrame(values[:, 1:], columns=list(COLUMNS[2:]))
+            frame.insert(0, "class", values[:, 0].astype(np.int16))
+            frame.insert(0, "image", image_id)
+            frames.append(frame)
+    if not frames:
+        return _empty_labels()
+    return pd.concat(frames, ignore_index=True)
+
+
+def _empty_labels() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "image": pd.Series([], dtype=object),
+            "class": pd.Series([], dtype=np.int16),
+            **{column: pd.Series([], dtype=np.float32) for column in COLUMNS[2:]},
+        }
+    )
+
+
+class LabelIndex:
+    """Every row of the YOLO label files of a directory, in a single table.
+
+    The table (image id, class, x, y, w, h) is stored next to the label
+    directory in a Parquet file, along with the modification time of each
+    label file. `LabelIndex.load` only parses the files added or modified
+    since, and drops the removed ones; otherwise loading the index costs a
+    directory listing and one file read, instead of a parse of every file.
+
+    Queries are vectorized over the table: sampler weights, targets of the
+    dataset, class counts and ground truth boxes of the evaluation.
+
+    Args:
+        labels (pd.DataFrame): Rows of the label files, with the columns of `COLUMNS`.
+        mtimes (dict[str, int] | None, optional): Modification time of each indexed
+            label file, empty ones included. Defaults to None (images of *labels*, unknown times).
+    """
+
+    def __init__(self, labels: pd.DataFrame, mtimes: dict[str, int] | None = None) -> None:
+        self.labels = labels.sort_values("image", kind="stable").reset_index(drop=True)
+        self.mtimes = dict(mtimes) if mtimes is not None else dict.fromkeys(self.labels["image"].unique(), 0)
+
+        # rows of image i are values[offsets[i]:offsets[i + 1]]
+        images = self.labels["image"].to_numpy()
+        starts = np.flatnonzero(np.append(True, images[1:] != images[:-1])) if len(images) else np.zeros(0, np.int64)
+        self._positions = {image_id: i for i, image_id in enumerate(images[starts])}
+        self._offsets = np.append(starts, len(images))
+        self._values = np.column_stack(
+            [self.labels["class"].to_numpy(np.float32), self.labels[list(COLUMNS[2:])].to_numpy(np.float32)]
+        ).reshape(-1, 5)
+
+    @classmethod
+    def load(cls, label_dir: str | Path, index_file: str | Path | None = None) -> "LabelIndex":
+        """Index of the label files of *label_dir*, updated from the files modified since it was saved.
+
+        Args:
+            label_dir (str | Path): Directory of the YOLO label files.
+            index_file (str | Path | None, optional): Parquet file of the index.
+                Defaults to None ("labels_index.parquet" next to *label_dir*).
+
+        Returns:
+            LabelIndex: the up-to-date index, saved again if anything changed.
+        """
+        label_dir = Path(label_dir)
+        index_file = Path(index_file) if index_file is not None else label_dir.parent / INDEX_FILENAME
+        mtimes = _label_mtimes(label_dir)
+
+        labels, indexed_mtimes = _empty_labels(), {}
+        if index_file.exists():
+            table = pq.read_table(index_file)
+            labels = table.to_pandas()
+            indexed_mtimes = json.loads(table.schema.metadata[_MTIMES_KEY])
+        if indexed_mtimes == mtimes:
+            return cls(labels, mtimes)
+
+        stale = {image_id for image_id, mtime in mtimes.items() if indexed_mtimes.get(image_id) != mtime}
+        kept = labels[labels["image"].isin(mtimes.keys() - stale)]
+        index = cls(pd.concat([kept, _parse_labels(label_dir, sorted(stale))], ignore_index=True), mtimes)
+        index.save(index_file)
+        return index
+
+    def save(self, index_file: str | Path) -> None:
+        """Write the index to a Parquet file, atomically."""
+        index_file = Path(index_file)
+        table = pa.Table.from_pandas(self.labels[list(COLUMNS)], preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), _MTIMES_KEY: json.dumps(self.mtimes).encode()}
+        )
+        tmp_file = index_file.with_name(f"{index_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        pq.write_table(table, tmp_file)
+        os.replace(tmp_file, index_file)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def targets(self, image_id: str) -> np.ndarray:
+        """(N, 5) float32 class_id x y w h rows of an image, a read-only view of the index."""
+        i = self._positions.get(image_id)
+        if i is None:
+            return np.zeros((0, 5), dtype=np.float32)
+        targets = self._values[self._offsets[i]:self._offsets[i + 1]]
+        targets.flags.writeable = False
+        return targets
+
+    def sample_weights(self, image_ids: Sequence[str], rare_classes: Iterable[int], boost: float) -> np.ndarray:
+        """Weight of each image for a `WeightedRandomSampler`: *boost* if it has a rare class, else 1."""
+        is_rare = self.labels["class"].isin(list(rare_classes)).to_numpy()
+        rare_images = pd.unique(self.labels["image"].to_numpy()[is_rare])
+        return np.where(pd.Index(image_ids).isin(rare_images), boost, 1.0)
+
+    def class_counts(self, nc: int, image_ids: Sequence[str] | None = None) -> np.ndarray:
+        """Number of boxes of each of the *nc* classes, in all images or in *image_ids* only."""
+        classes = self.labels["class"]
+        if image_ids is not None:
+            classes = classes[self.labels["image"].isin(image_ids)]
+        return np.bincount(classes.to_numpy(np.int64), minlength=nc)[:nc]
+
+    def ground_truth(self, image_ids: Sequence[str] | None = None) -> pd.DataFrame:
+        """Boxes of *image_ids* (all images by default) as image, class and normalized x1, y1, x2, y2.
+
+        Multiply the corners by the width and height of an image to get them in pixels.
+        """
+        labels = self.labels if image_ids is None else self.labels[self.labels["image"].isin(image_ids)]
+        half_w, half_h = labels["w"] / 2, labels["h"] / 2
+        return pd.DataFrame(
+            {
+                "image": labels["image"],
+                "class": labels["class"],
+                "x1": labels["x"] - half_w,
+                "y1": labels["y"] - half_h,
+                "x2": labels["x"] + half_w,
+                "y2": labels["y"] + half_h,
+            }
+        ).reset_index(drop=True)
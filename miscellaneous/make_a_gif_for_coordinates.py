@@ -8,9 +8,10 @@ import osmnx as ox
 from PIL import Image, ImageDraw, ImageFont
 from shapely.geometry import box
 
-from miscellaneous.ask_mapbox_for_image import ask_mapbox_for_image
 from miscellaneous.clean_overlapping_bboxes import clean_overlapping_bboxes
 from miscellaneous.create_bbox_from_coordinates import create_bbox_from_coordinates
+from miscellaneous.mapbox_image_fetcher import MapboxImageFetcher
+from miscellaneous.tile_cache import TileCache
 
 
 def _get_font(size: int = 20) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
@@ -117,8 +118,8 @@ def make_a_gif_for_coordinates(
         max_cleaning_iterations (int): Max number of cleaning passes (stops early if stable). Defaults to 50.
         frame_duration (int): Duration of each frame in milliseconds. Defaults to 1000.
         loop (int): Number of times the GIF loops (0 = infinite). Defaults to 0.
-        image_cache_dir (str | Path | None): Directory to cache satellite images.
-            If provided, images are saved/loaded from this directory to avoid re-fetching.
+        image_cache_dir (str | Path | None): Directory of a TileCache of satellite images.
+            If provided, images already fetched are read from it instead of Mapbox.
             Defaults to None (no caching).
 
     Returns:
@@ -137,25 +138,15 @@ def make_a_gif_for_coordinates(
     )
 
     # ---- 2. Fetch satellite image from Mapbox (with cache) ---------------------
-    cache_path = None
-    if image_cache_dir is not None:
-        cache_dir = Path(image_cache_dir)
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        cache_path = cache_dir / f"satellite_{lat}_{lon}.png"
-
-    if cache_path and cache_path.exists():
-        image = Image.open(cache_path)
-        print(f"Loaded cached image from {cache_path}")
-    else:
-        save_path = cache_path if cache_path else Path("satellite_tmp.png")
-        image = ask_mapbox_for_image(
-            output_file=save_path,
-            image_width_height={"width": img_width, "height": img_height},
-            mapbox_token=mapbox_token,
-            bounding_box=bbox,
-        )
-        if cache_path:
-            print(f"Cached image saved to {cache_path}")
+    cache = TileCache(image_cache_dir) if image_cache_dir is not None else None
+    with MapboxImageFetcher(
+        mapbox_token,
+        image_width_height={"width": img_width, "height": img_height},
+        cache=cache,
+    ) as fetcher:
+        image = fetcher.fetch(bbox)
+    if cache is not None:
+        cache.close()
 
     # ---- 3. Crop the 30px watermark at the bottom ------------------------------
     base_image = image.crop(box=(0, 0, img_width, img_height - 30))
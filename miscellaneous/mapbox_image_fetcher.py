@@ -0,0 +1,144 @@
+"""Fetch many Mapbox satellite images over a pool of kept-alive connections."""
+
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+from miscellaneous.ask_mapbox_for_image import MAPBOX_STATIC_URL, MAPBOX_STYLE, build_mapbox_url
+from miscellaneous.resilience import Retrying
+from miscellaneous.tile_cache import TileCache
+
+
+class MapboxImageFetcher:
+    """Fetch static images from Mapbox through one pooled `requests.Session`.
+
+    Connections are kept alive and reused between requests, so only the first
+    request to the server pays for the TCP and TLS handshakes. `fetch_many`
+    downloads tiles concurrently on a bounded thread pool. With a *cache*,
+    tiles already fetched are read from disk instead of the network. Requests
+    failing with a transient error are retried, see `Retrying`.
+
+    Use it as a context manager, or call `close`, to release the connections.
+
+    Args:
+        mapbox_token (str): Mapbox access token.
+        image_width_height (dict[str, int]): Dictionary with keys 'width' and 'height' for image dimensions.
+        request_timeout (int, optional): Timeout of each request in seconds. Defaults to 10 seconds.
+        pool_size (int, optional): Maximum number of connections kept open. Defaults to 8.
+        style (str, optional): Mapbox style id. Defaults to "mapbox/satellite-v9".
+        base_url (str, optional): Root of the styles API, e.g. a local test server.
+            Defaults to the Mapbox one.
+        cache (TileCache | None, optional): On-disk cache of the fetched tiles.
+            Defaults to None (no cache).
+        retrying (Retrying | None, optional): Retry policy, shared by all the
+            requests of the fetcher. Defaults to None (a `Retrying` with default settings).
+    """
+
+    def __init__(
+        self,
+        mapbox_token: str,
+        image_width_height: dict[str, int],
+        request_timeout: int = 10,
+        pool_size: int = 8,
+        style: str = MAPBOX_STYLE,
+        base_url: str = MAPBOX_STATIC_URL,
+        cache: TileCache | None = None,
+        retrying: Retrying | None = None,
+    ) -> None:
+        self.mapbox_token = mapbox_token
+        self.image_width_height = image_width_height
+        self.request_timeout = request_timeout
+        self.pool_size = pool_size
+        self.style = style
+        self.base_url = base_url
+        self.cache = cache
+        self.retrying = retrying or Retrying()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __enter__(self) -> "MapboxImageFetcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+
+    def url(self, bounding_box: dict[str, float]) -> str:
+        """URL of the image of a bounding box."""
+        return build_mapbox_url(
+            self.image_width_height,
+            self.mapbox_token,
+            bounding_box,
+            style=self.style,
+            base_url=self.base_url,
+        )
+
+    def fetch_bytes(self, bounding_box: dict[str, float]) -> bytes:
+        """Download the encoded image of a bounding box, or read it from the cache.
+
+        Args:
+            bounding_box (dict[str, float]): Dictionary with keys 'west', 'south', 'east', 'north'.
+
+        Raises:
+            requests.HTTPError: If the server answers with an error status, after retries.
+            RetryBudgetExceeded: If the retry budget is spent.
+
+        Returns:
+            bytes: image as returned by the server.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                self.style,
+                bounding_box,
+                self.image_width_height["width"],
+                self.image_width_height["height"],
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        content = self.retrying.call(self._download, self.url(bounding_box))
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+
+    def _download(self, url: str) -> bytes:
+        response = self.session.get(url, timeout=self.request_timeout)
+        response.raise_for_status()
+        return response.content
+
+    def fetch(self, bounding_box: dict[str, float]) -> Image.Image:
+        """Download and decode the image of a bounding box."""
+        return Image.open(BytesIO(self.fetch_bytes(bounding_box)))
+
+    def fetch_many(
+        self,
+        bounding_boxes: Sequence[dict[str, float]],
+        max_workers: int | None = None,
+    ) -> list[bytes]:
+        """Download the images of many bounding boxes concurrently.
+
+        Args:
+            bounding_boxes (Sequence[dict[str, float]]): Bounding boxes to fetch.
+            max_workers (int | None, optional): Number of concurrent downloads.
+                Defaults to None (the pool size).
+
+        Raises:
+            requests.HTTPError: If the server answers with an error status.
+
+        Returns:
+            list[bytes]: encoded images, in the order of *bounding_boxes*.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as executor:
+            return list(executor.map(self.fetch_bytes, bounding_boxes))
@@ -0,0 +1,137 @@
+"""NumPy kernel merging overlapping axis-aligned boxes, without shapely."""
+
+import numpy as np
+
+
+def _overlap_edges(
+    boxes: np.ndarray,
+    areas: np.ndarray,
+    threshold: float,
+    block_size: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Find every pair (i, j), i < j, overlapping above *threshold*.
+
+    Boxes are swept in order of their minx: a block of boxes is only compared
+    with the following boxes starting before the block's largest maxx. Ratios
+    are computed on blocks of at most `block_size × block_size` pairs so memory
+    stays bounded whatever the number of boxes.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: row and column indices of the pairs,
+            sorted by row then column.
+    """
+    n = len(boxes)
+    perm = np.argsort(boxes[:, 0], kind="stable")
+    boxes = boxes[perm]
+    areas = areas[perm]
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+
+    for i0 in range(0, n, block_size):
+        i1 = min(i0 + block_size, n)
+        box_i = boxes[i0:i1, None, :]
+        area_i = areas[i0:i1, None]
+        sweep_end = np.searchsorted(boxes[:, 0], boxes[i0:i1, 2].max(), side="right")
+
+        for j0 in range(i0, sweep_end, block_size):
+            j1 = min(j0 + block_size, sweep_end)
+            box_j = boxes[None, j0:j1, :]
+            area_j = areas[None, j0:j1]
+
+            inter_w = np.minimum(box_i[..., 2], box_j[..., 2]) - np.maximum(box_i[..., 0], box_j[..., 0])
+            inter_h = np.minimum(box_i[..., 3], box_j[..., 3]) - np.maximum(box_i[..., 1], box_j[..., 1])
+            inter_area = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                overlapping = (inter_area / area_i > threshold) | (inter_area / area_j > threshold)
+            overlapping &= (area_i > 0) & (area_j > 0)
+            if j0 == i0:
+                overlapping = np.triu(overlapping, k=1)
+
+            r, c = np.nonzero(overlapping)
+            rows.append(perm[r + i0])
+            cols.append(perm[c + j0])
+
+    if not rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    r = np.concatenate(rows)
+    c = np.concatenate(cols)
+    r, c = np.minimum(r, c), np.maximum(r, c)
+    order = np.lexsort((c, r))
+    return r[order], c[order]
+
+
+def merge_axis_aligned_boxes(
+    boxes: np.ndarray,
+    threshold: float = 0.3,
+    block_size: int = 1024,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Perform one merging pass on an array of axis-aligned boxes.
+
+    Same rules as `clean_overlapping_bboxes`: each box, in order, is merged with
+    the first later box overlapping it above *threshold* (ratio of the
+    intersection area to either box's area), boxes with no area are dropped,
+    and the merged box is the envelope of both.
+
+    Args:
+        boxes (np.ndarray): (N, 4) array of minx, miny, maxx, maxy.
+        threshold (float, optional): If intersection_area / box_area exceeds
+            this value the pair is merged. Defaults to 0.3.
+        block_size (int, optional): Side of the blocks of the pair matrix
+            computed at once. Defaults to 1024.
+
+    Raises:
+        ValueError: If boxes is not an (N, 4) array.
+        ValueError: If the threshold is negative.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (M, 4) boxes after the pass, un-merged
+            boxes first then merged ones, and for each of them the index of
+            the input box whose metadata it keeps (the larger one when merged).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if boxes.ndim != 2 or boxes.shape[1] != 4:
+        raise ValueError("Boxes must be an (N, 4) array of minx, miny, maxx, maxy.")
+    if threshold < 0:
+        raise ValueError("Threshold must be positive.")
+
+    n = len(boxes)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    rows, cols = _overlap_edges(boxes, areas, threshold, block_size)
+    row_start = np.searchsorted(rows, np.arange(n + 1))
+
+    removed = np.zeros(n, dtype=bool)
+    merged_a: list[int] = []
+    merged_b: list[int] = []
+    for idx_a in range(n):
+        if removed[idx_a]:
+            continue
+
+        if areas[idx_a] == 0:
+            removed[idx_a] = True
+            continue
+
+        candidates = cols[row_start[idx_a]:row_start[idx_a + 1]]
+        candidates = candidates[~removed[candidates]]
+        if candidates.size:
+            removed[idx_a] = True
+            removed[candidates[0]] = True
+            merged_a.append(idx_a)
+            merged_b.append(int(candidates[0]))
+
+    idx_a = np.asarray(merged_a, dtype=np.intp)
+    idx_b = np.asarray(merged_b, dtype=np.intp)
+    merged_boxes = np.column_stack(
+        (
+            np.minimum(boxes[idx_a, :2], boxes[idx_b, :2]),
+            np.maximum(boxes[idx_a, 2:], boxes[idx_b, 2:]),
+        )
+    )
+    larger = np.where(areas[idx_a] >= areas[idx_b], idx_a, idx_b)
+
+    remaining = np.flatnonzero(~removed)
+    return (
+        np.concatenate((boxes[remaining], merged_boxes)),
+        np.concatenate((remaining, larger)),
+    )
@@ -0,0 +1,197 @@
+"""Training images and labels packed once into memory-mapped arrays, and the dataset reading them."""
+
+import json
+import os
+import random
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+from miscellaneous.label_index import label_path_of, read_yolo_labels
+
+IMAGES_FILE = "images.npy"
+LABEL_OFFSETS_FILE = "label_offsets.npy"
+LABEL_VALUES_FILE = "label_values.npy"
+INDEX_FILE = "index.json"
+
+
+def is_packed(
+    image_paths: Sequence[str | Path],
+    label_dir: str | Path,
+    output_dir: str | Path,
+    img_size: int = 640,
+) -> bool:
+    """Whether *output_dir* holds *image_paths* packed at *img_size*, newer than the images and their labels."""
+    index_path = Path(output_dir) / INDEX_FILE
+    if not index_path.exists():
+        return False
+    with open(index_path, "r") as f:
+        index = json.load(f)
+    if index["img_size"] != img_size or index["images"] != [os.path.basename(p) for p in image_paths]:
+        return False
+
+    packed_at = index_path.stat().st_mtime
+    for image_path in image_paths:
+        label_path = label_path_of(image_path, label_dir)
+        if os.path.getmtime(image_path) > packed_at or (label_path.exists() and label_path.stat().st_mtime > packed_at):
+            return False
+    return True
+
+
+def pack_yolo_dataset(
+    image_paths: Sequence[str | Path],
+    label_dir: str | Path,
+    output_dir: str | Path,
+    img_size: int = 640,
+    force: bool = False,
+) -> Path:
+    """Decode, resize and pack images and labels once, for `PackedYoloDataset`.
+
+    Writes in *output_dir*:
+        - images.npy: (N, img_size, img_size, 3) uint8 array of the resized RGB images;
+        - label_offsets.npy: (N + 1,) int64 array, labels of image i are rows
+          offsets[i]:offsets[i + 1] of the values;
+        - label_values.npy: (M, 5) float32 array of class_id x y w h rows;
+        - index.json: image names, in the order of the arrays, and image size.
+
+    Images are resized exactly as `YoloDetectionDataset` does. Nothing is
+    written if the arrays are already up to date (see `is_packed`), so the
+    packing only runs again when images or labels change.
+
+    Args:
+        image_paths (Sequence[str | Path]): Images to pack, in this order.
+        label_dir (str | Path): Directory of the YOLO label files.
+        output_dir (str | Path): Directory where the arrays are written.
+        img_size (int, optional): Side of the resized images. Defaults to 640.
+        force (bool, optional): Pack again even if up to date. Defaults to False.
+
+    Returns:
+        Path: *output_dir*.
+    """
+    output_dir = Path(output_dir)
+    if not force and is_packed(image_paths, label_dir, output_dir, img_size):
+        return output_dir
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # written last: an interrupted packing is never taken for an up to date one
+    (output_dir / INDEX_FILE).unlink(missing_ok=True)
+
+    images = np.lib.format.open_memmap(
+        output_dir / IMAGES_FILE, mode="w+", dtype=np.uint8, shape=(len(image_paths), img_size, img_size, 3)
+    )
+    labels = []
+    for i, image_path in enumerate(image_paths):
+        with Image.open(image_path) as img:
+            images[i] = np.asarray(img.convert('RGB').resize((img_size, img_size)))
+        labels.append(read_yolo_labels(label_path_of(image_path, label_dir)))
+    images.flush()
+    del images
+
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum([len(label) for label in labels], out=offsets[1:])
+    np.save(output_dir / LABEL_OFFSETS_FILE, offsets)
+    np.save(
+        output_dir / LABEL_VALUES_FILE,
+        np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32),
+    )
+    with open(output_dir / INDEX_FILE, "w") as f:
+        json.dump({"img_size": img_size, "images": [os.path.basename(p) for p in image_paths]}, f)
+    return output_dir
+
+
+class PackedYoloDataset(Dataset):
+    """YOLO dataset read from the arrays of `pack_yolo_dataset`, with the samples of `YoloDetectionDataset`.
+
+    Images are memory-mapped and returned as uint8 (3, H, W) views of the
+    file, without decoding nor copy. Convert batches to float on the device
+    with `images_to_float`. The arrays are opened lazily, so that every
+    DataLoader worker maps them itself.
+
+    Args:
+        packed_dir (str | Path): Directory written by `pack_yolo_dataset`.
+        indices (Sequence[int] | None, optional): Positions of the images to use,
+            e.g. a train/val split. Defaults to None (all).
+        augment (bool, optional): Random horizontal and vertical flips, as in
+            `YoloDetectionDataset`. Defaults to False.
+    """
+
+    def __init__(self, packed_dir: str | Path, indices: Sequence[int] | None = None, augment: bool = False) -> None:
+        self.packed_dir = Path(packed_dir)
+        with open(self.packed_dir / INDEX_FILE, "r") as f:
+            index = json.load(f)
+        self.img_size = index["img_size"]
+        self.image_names = index["images"]
+        self.indices = np.arange(len(self.image_names)) if indices is None else np.asarray(indices)
+        self.augment = augment
+        self._arrays: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+
+    @classmethod
+    def of_images(
+        cls, packed_dir: str | Path, image_paths: Sequence[str | Path], augment: bool = False
+    ) -> "PackedYoloDataset":
+        """Dataset of the packed *image_paths*, in this order, matched by file name.
+
+        Raises:
+            ValueError: If some of the images are not packed in *packed_dir*.
+        """
+        dataset = cls(packed_dir, augment=augment)
+        positions = {name: i for i, name in enumerate(dataset.image_names)}
+        names = [os.path.basename(p) for p in image_paths]
+        missing = [name for name in names if name not in positions]
+        if missing:
+            raise ValueError(f"{len(missing)} images are not packed in {packed_dir}, e.g. {missing[0]}.")
+        dataset.indices = np.array([positions[name] for name in names], dtype=np.int64)
+        return dataset
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getstate__(self) -> dict:
+        # workers map the files again rather than pickling the arrays
+        return {**self.__dict__, "_arrays": None}
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Images, label offsets and label values, mapped on first use."""
+        if self._arrays is None:
+            self._arrays = (
+                np.load(self.packed_dir / IMAGES_FILE, mmap_mode="c"),
+                np.load(self.packed_dir / LABEL_OFFSETS_FILE),
+                np.load(self.packed_dir / LABEL_VALUES_FILE, mmap_mode="c"),
+            )
+        return self._arrays
+
+    def targets(self, idx: int) -> np.ndarray:
+        """(N, 5) labels of sample *idx*, a view of the packed values."""
+        _, offsets, values = self.arrays()
+        i = self.indices[idx]
+        return values[offsets[i]:offsets[i + 1]]
+
+    def __getitem__(self, idx: int) -> tuple[torch.Tensor, torch.Tensor]:
+        images, _, _ = self.arrays()
+        img = torch.from_numpy(images[self.indices[idx]]).permute(2, 0, 1)
+        targets = torch.from_numpy(self.targets(idx))
+
+        if self.augment:
+            if random.random() < 0.5:  # Flip horizontal
+                img = img.flip(2)
+                targets = targets.clone()
+                targets[:, 1] = 1.0 - targets[:, 1]
+            if random.random() < 0.5:  # Flip vertical
+                img = img.flip(1)
+                targets = targets.clone()
+                targets[:, 2] = 1.0 - targets[:, 2]
+
+        return img, targets
+
+
+def images_to_float(imgs: torch.Tensor, device: torch.device | str, non_blocking: bool = True) -> torch.Tensor:
+    """Move an image batch to *device*, then scale it to float in [0, 1] there if it is uint8.
+
+    Float batches, e.g. of `YoloDetectionDataset`, are only moved, so the
+    training loop is the same for both datasets.
+    """
+    imgs = imgs.to(device, non_blocking=non_blocking)
+    return imgs.float().div_(255.0) if imgs.dtype == torch.uint8 else imgs.float()
@@ -0,0 +1,103 @@
+"""Fetch the buildings of whole regions once, then serve the tiles inside them from memory."""
+
+import threading
+from collections.abc import Callable, Iterable, Mapping
+
+import geopandas as gpd
+
+from miscellaneous.acquisition_pipeline import fetch_osm_buildings
+from miscellaneous.building_store import BuildingStore
+from miscellaneous.get_random_points_in_bbox import TILE_FOOTPRINT_M
+from miscellaneous.get_transformer import get_transformer
+
+_FetchBuildings = Callable[[tuple[float, float, float, float]], gpd.GeoDataFrame | None]
+
+
+def _pad_bbox(bbox: dict[str, float], padding: float) -> tuple[float, float, float, float]:
+    """(west, south, east, north) of *bbox* grown by *padding* meters on every side, in Lambert 93."""
+    to_l93 = get_transformer("EPSG:4326", "EPSG:2154")
+    to_wgs84 = get_transformer("EPSG:2154", "EPSG:4326")
+    minx, miny = to_l93.transform(bbox["west"], bbox["south"])
+    maxx, maxy = to_l93.transform(bbox["east"], bbox["north"])
+    west, south = to_wgs84.transform(minx - padding, miny - padding)
+    east, north = to_wgs84.transform(maxx + padding, maxy + padding)
+    return west, south, east, north
+
+
+class RegionPrefetcher:
+    """Serves the buildings of tiles from one OSM query per region instead of one per tile.
+
+    The tiles of a city are sampled inside its 10km box from
+    `create_bbox_from_city_coordinates`. The first tile of a region triggers
+    the query of the whole region, grown by *padding* so that tiles centered
+    near its edge are covered too. Its buildings go into a `BuildingStore`,
+    whose spatial index serves this tile and all the next ones. As osmnx
+    returns every feature intersecting the queried bbox, a tile gets the same
+    features as with its own query. Tiles outside every region fall back to a
+    query of their own.
+
+    `fetch_buildings` can replace `fetch_osm_buildings` in the acquisition
+    pipeline and in `build_dataset`; it is safe to call from several threads.
+    Responses are also cached on disk by osmnx (`ox.settings.use_cache`).
+
+    Args:
+        regions (Mapping[str, dict[str, float]]): Bbox of each region name, with
+            keys "west", "south", "east" and "north".
+        fetch_region (Callable, optional): Returns the buildings of a
+            (west, south, east, north) bbox, or None. Defaults to an osmnx query.
+        fallback (Callable, optional): Same, for the tiles outside every region.
+            Defaults to an osmnx query.
+        padding (float, optional): Margin added around the regions, in meters.
+            Defaults to half the footprint of a 512px tile at 0.4m per pixel.
+    """
+
+    def __init__(
+        self,
+        regions: Mapping[str, dict[str, float]],
+        fetch_region: _FetchBuildings = fetch_osm_buildings,
+        fallback: _FetchBuildings = fetch_osm_buildings,
+        padding: float = TILE_FOOTPRINT_M / 2,
+    ) -> None:
+        self.fetch_region = fetch_region
+        self.fallback = fallback
+        self.region_bboxes = {name: _pad_bbox(bbox, padding) for name, bbox in regions.items()}
+        self.region_queries = 0
+        self.tile_queries = 0
+
+        self._stores: dict[str, BuildingStore | None] = {}
+        self._locks = {name: threading.Lock() for name in self.region_bboxes}
+        self._count_lock = threading.Lock()
+
+    def region_of(self, bbox: tuple[float, float, float, float]) -> str | None:
+        """Name of the first region containing the whole (west, south, east, north) *bbox*, if any."""
+        west, south, east, north = bbox
+        for name, (r_west, r_south, r_east, r_north) in self.region_bboxes.items():
+            if r_west <= west and r_south <= south and east <= r_east and north <= r_north:
+                return name
+        return None
+
+    def store(self, name: str) -> BuildingStore | None:
+        """Buildings of a region, queried on first use. None if the region has no building."""
+        with self._locks[name]:
+            if name not in self._stores:
+                features = self.fetch_region(self.region_bboxes[name])
+                with self._count_lock:
+                    self.region_queries += 1
+                self._stores[name] = None if features is None else BuildingStore(features)
+        return self._stores[name]
+
+    def prefetch(self, names: Iterable[str] | None = None) -> None:
+        """Query the regions *names* (all by default) now rather than on their first tile."""
+        for name in self.region_bboxes if names is None else names:
+            self.store(name)
+
+    def fetch_buildings(self, bbox: tuple[float, float, float, float]) -> gpd.GeoDataFrame | None:
+        """Buildings of a (west, south, east, north) tile bbox, None if there is none."""
+        name = self.region_of(bbox)
+        if name is None:
+            with self._count_lock:
+                self.tile_queries += 1
+            return self.fallback(bbox)
+
+        store = self.store(name)
+        return None if store is None else store.fetch_buildings(bbox)
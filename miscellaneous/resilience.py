@@ -0,0 +1,277 @@
+"""Retries with exponential backoff, a time budget and a circuit breaker, for flaky upstreams."""
+
+import email.utils
+import random
+import re
+import sys
+import threading
+import time
+from collections.abc import Callable
+from typing import TypeVar
+
+import requests
+
+T = TypeVar("T")
+
+# Throttling and transient server errors
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Status code in the message of osmnx's ResponseStatusCodeError ("'host' responded: 429 ...")
+_OSMNX_STATUS_PATTERN = re.compile(r"responded: (\d{3})\b")
+
+# Seconds between two checks of a call waiting for the probe of a half-open circuit
+PROBE_POLL_INTERVAL = 0.1
+
+
+class RetryBudgetExceeded(TimeoutError):
+    """Raised when waiting before a retry would overrun the time budget of a `Retrying`."""
+
+
+def _osmnx_status_error() -> type[Exception] | None:
+    """osmnx's ResponseStatusCodeError, None if osmnx is not loaded (its errors cannot be raised then)."""
+    return getattr(sys.modules.get("osmnx._errors"), "ResponseStatusCodeError", None)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a call failing with *error* is worth retrying.
+
+    Timeouts, lost connections, throttling (429) and server errors (5xx) are
+    transient. Anything else, e.g. osmnx's InsufficientResponseError when there
+    is no building in a bbox, or a ResponseStatusCodeError for a 400 (malformed
+    query), is not.
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRYABLE_STATUS_CODES
+    status_error = _osmnx_status_error()
+    if status_error is not None and isinstance(error, status_error):
+        # osmnx only keeps the status code in the message
+        match = _OSMNX_STATUS_PATTERN.search(str(error))
+        status_code = int(match.group(1)) if match else None
+        return status_code is not None and (status_code == 429 or 500 <= status_code < 600)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """Delay asked by the server in the Retry-After header of a failed response, if any.
+
+    The header holds either a number of seconds or an HTTP date.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """Pauses the calls to an upstream that keeps failing.
+
+    After *failure_threshold* consecutive transient failures the circuit opens:
+    calls wait until *reset_timeout* seconds have passed since the last failure.
+    The circuit is then half-open: a single call, the probe, goes through while
+    the others keep waiting. Its success closes the circuit, its failure opens
+    it again. The breaker can be shared by the threads of one process.
+
+    Args:
+        failure_threshold (int, optional): Consecutive failures opening the circuit. Defaults to 5.
+        reset_timeout (float, optional): Pause in seconds once the circuit is open. Defaults to 30.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be positive.")
+        if reset_timeout < 0:
+            raise ValueError("reset_timeout must not be negative.")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        # thread making the probe call of the half-open circuit, if any
+        self._probe_thread: int | None = None
+
+    @property
+    def state(self) -> str:
+        """State of the circuit: "closed", "open" (pausing) or "half-open" (pause over, probing)."""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "open" if self._pause_left() > 0 else "half-open"
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls currently have to wait."""
+        return self.wait_time() > 0
+
+    def _pause_left(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def _wait_time(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        pause_left = self._pause_left()
+        if pause_left > 0:
+            return pause_left
+        if self._probe_thread in (None, threading.get_ident()):
+            return 0.0
+        return PROBE_POLL_INTERVAL
+
+    def wait_time(self) -> float:
+        """Seconds to wait before the next call, 0 if it can go now."""
+        with self._lock:
+            return self._wait_time()
+
+    def acquire(self) -> float:
+        """Like `wait_time`, but a 0 in the half-open state makes the caller the probe.
+
+        The probe ends with `record_success`, `record_failure` or `release`,
+        called from the same thread.
+        """
+        with self._lock:
+            wait_time = self._wait_time()
+            if wait_time == 0 and self._opened_at is not None:
+                self._probe_thread = threading.get_ident()
+            return wait_time
+
+    def release(self) -> None:
+        """End the probe of the calling thread, if any, without changing the state.
+
+        For probes failing with an error that says nothing about the upstream:
+        the next call becomes the probe.
+        """
+        with self._lock:
+            if self._probe_thread == threading.get_ident():
+                self._probe_thread = None
+
+    def record_success(self) -> None:
+        """Close the circuit."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_thread = None
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit once the threshold is reached or if it was the probe."""
+        with self._lock:
+            self._failures += 1
+            is_probe = self._probe_thread == threading.get_ident()
+            if is_probe:
+                self._probe_thread = None
+            if is_probe or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class Retrying:
+    """Calls functions again when they fail with a transient error.
+
+    Before retry n (from 0), waits a random delay in [0, min(max_delay, base_delay * 2**n)]
+    ("full jitter", so that concurrent clients do not retry in lockstep), or the
+    server's Retry-After if it asks for longer. Calls also wait while the
+    circuit *breaker* is open, and while another call probes it once half-open.
+
+    The *budget* caps the total time spent waiting, summed over all the calls
+    made through this object, e.g. over a whole acquisition run. A wait that
+    would overrun it raises `RetryBudgetExceeded` instead. Share one instance
+    per upstream across a run so that calls share the budget and the breaker.
+
+    Args:
+        max_attempts (int, optional): Attempts per call, including the first one. Defaults to 6.
+        base_delay (float, optional): Scale of the backoff in seconds. Defaults to 0.5.
+        max_delay (float, optional): Cap of the backoff in seconds (not of Retry-After). Defaults to 60.
+        budget (float | None, optional): Total waiting time allowed in seconds.
+            Defaults to None (no limit).
+        breaker (CircuitBreaker | None, optional): Circuit breaker of the upstream.
+            Defaults to None (a new `CircuitBreaker`).
+        is_retryable (Callable[[BaseException], bool], optional): Tells which errors
+            are transient. Defaults to `is_transient_error`.
+        seed (int | None, optional): Seed of the jitter. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+        budget: float | None = None,
+        breaker: CircuitBreaker | None = None,
+        is_retryable: Callable[[BaseException], bool] = is_transient_error,
+        seed: int | None = None,
+    ) -> None:
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be positive.")
+        if base_delay < 0 or max_delay < 0:
+            raise ValueError("Delays must not be negative.")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker = breaker or CircuitBreaker()
+        self.is_retryable = is_retryable
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._waited = 0.0
+
+    @property
+    def waited(self) -> float:
+        """Total time waited so far, in seconds."""
+        return self._waited
+
+    def backoff(self, retry: int) -> float:
+        """Random delay before retry number *retry* (from 0)."""
+        cap = min(self.max_delay, self.base_delay * 2**retry)
+        with self._lock:
+            return self._rng.uniform(0, cap)
+
+    def _wait(self, delay: float, error: BaseException | None = None) -> None:
+        """Sleep *delay* seconds, charged to the budget."""
+        if delay <= 0:
+            return
+        with self._lock:
+            if self.budget is not None and self._waited + delay > self.budget:
+                raise RetryBudgetExceeded(
+                    f"Waiting {delay:.1f}s more would exceed the retry budget of {self.budget}s."
+                ) from error
+            self._waited += delay
+        time.sleep(delay)
+
+    def call(self, function: Callable[..., T], *args, **kwargs) -> T:
+        """Call `function(*args, **kwargs)`, retrying it on transient errors.
+
+        Raises:
+            RetryBudgetExceeded: If a wait would overrun the budget.
+            Exception: The last error of *function*, if it is not transient or
+                if all attempts failed.
+
+        Returns:
+            T: what *function* returned.
+        """
+        retry = 0
+        while True:
+            while (wait_time := self.breaker.acquire()) > 0:
+                self._wait(wait_time)
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as error:
+                if not isinstance(error, Exception) or not self.is_retryable(error):
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if retry + 1 >= self.max_attempts:
+                    raise
+                delay = max(self.backoff(retry), retry_after_seconds(error) or 0.0)
+                self._wait(delay, error)
+                retry += 1
+                continue
+            self.breaker.record_success()
+            return result
@@ -0,0 +1,120 @@
+"""Content-addressed on-disk cache of map tiles, with LRU eviction."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class TileCache:
+    """Stores the raw bytes of fetched tiles on disk, under a hash of their request.
+
+    Files live in a sharded directory (`ab/cd/abcd…`) so no directory grows too
+    large. An SQLite index keeps the size and last access time of every entry;
+    when the total size exceeds *max_bytes*, the least recently used entries
+    are deleted. The cache can be shared by the threads of one process.
+
+    Args:
+        cache_dir (str | Path): Directory holding the tiles and the index.
+        max_bytes (int, optional): Size cap of the stored tiles. Defaults to 2 GiB.
+        precision (int, optional): Number of decimals the bbox coordinates are
+            rounded to before hashing. Defaults to 7 (about 1cm).
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = 2 * 1024**3, precision: int = 7) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.precision = precision
+
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(self.cache_dir / "index.sqlite", check_same_thread=False)
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._index.commit()
+
+    def key(self, style: str, bounding_box: dict[str, float], width: int, height: int) -> str:
+        """Canonical hash of a tile request.
+
+        Args:
+            style (str): Map style id.
+            bounding_box (dict[str, float]): Dictionary with keys 'west', 'south', 'east', 'north'.
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+
+        Returns:
+            str: hexadecimal SHA-256 of the request.
+        """
+        canonical = json.dumps(
+            {
+                "style": style,
+                "bbox": [
+                    round(float(bounding_box[side]), self.precision)
+                    for side in ("west", "south", "east", "north")
+                ],
+                "width": int(width),
+                "height": int(height),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key[2:4] / key
+
+    def get(self, key: str) -> bytes | None:
+        """Return the stored bytes of *key*, or None if they are not cached."""
+        try:
+            data = self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._index.execute("UPDATE tiles SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._index.commit()
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store *data* under *key*, then evict old entries if the cache is too large."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._index.execute(
+                "INSERT OR REPLACE INTO tiles (key, size, last_access) VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+            self._evict()
+            self._index.commit()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the size cap is respected."""
+        (total,) = self._index.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        for key, size in self._index.execute(
+            "SELECT key, size FROM tiles ORDER BY last_access ASC"
+        ).fetchall():
+            self._path(key).unlink(missing_ok=True)
+            self._index.execute("DELETE FROM tiles WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def size(self) -> int:
+        """Total size in bytes of the cached tiles."""
+        with self._lock:
+            (total,) = self._index.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()
+        return total
+
+    def close(self) -> None:
+        """Close the index."""
+        self._index.close()
@@ -0,0 +1,132 @@
+"""Opt-in mixed precision and channels_last training, falling back to fp32 when numerics diverge."""
+
+import math
+from collections.abc import Callable
+
+import torch
+from torch import nn
+
+
+class TrainingPrecision:
+    """Numeric mode of the training: fp32, or autocast (bf16 on CPU, fp16 on GPU), with or without channels_last.
+
+    `train_step` runs the forward pass and the loss under autocast, and scales
+    the fp16 gradients with a `GradScaler` (bf16 has the range of fp32 and
+    needs none). If the loss of a step is not finite, or exceeds
+    *divergence_ratio* times its moving average, mixed precision is turned
+    off for the rest of the training and the step is computed again in fp32;
+    `fallback_reason` tells why. `mode` names the current mode, to log the
+    losses and mAP of each one.
+
+    Args:
+        device (torch.device | str): Device of the model.
+        mixed_precision (bool, optional): Train under autocast. Defaults to False.
+        channels_last (bool, optional): Store the model weights and the input images
+            in channels_last memory format, faster for convolutions. Defaults to False.
+        divergence_ratio (float, optional): Loss, relative to its moving average, above
+            which mixed precision is considered diverging. Defaults to 10.0.
+        warmup_steps (int, optional): Number of steps before the divergence check,
+            while the moving average settles. Defaults to 20.
+    """
+
+    def __init__(
+        self,
+        device: torch.device | str,
+        mixed_precision: bool = False,
+        channels_last: bool = False,
+        divergence_ratio: float = 10.0,
+        warmup_steps: int = 20,
+    ) -> None:
+        self.device_type = torch.device(device).type
+        self.dtype = torch.float16 if self.device_type == "cuda" else torch.bfloat16
+        self.mixed_precision = mixed_precision
+        self.channels_last = channels_last
+        self.divergence_ratio = divergence_ratio
+        self.warmup_steps = warmup_steps
+        self.fallback_reason: str | None = None
+
+        self.scaler = torch.amp.GradScaler(
+            self.device_type, enabled=mixed_precision and self.dtype == torch.float16
+        )
+        self._loss_average: float | None = None
+        self._steps = 0
+
+    @property
+    def mode(self) -> str:
+        """Current mode, e.g. "fp32", "bf16" or "fp16+channels_last"."""
+        mode = {torch.float16: "fp16", torch.bfloat16: "bf16"}[self.dtype] if self.mixed_precision else "fp32"
+        return f"{mode}+channels_last" if self.channels_last else mode
+
+    def prepare_model(self, model: nn.Module) -> nn.Module:
+        """Convert the weights of *model* to channels_last if enabled, in place."""
+        if self.channels_last:
+            model.to(memory_format=torch.channels_last)
+        return model
+
+    def prepare_inputs(self, imgs: torch.Tensor) -> torch.Tensor:
+        """*imgs* in channels_last memory format if enabled."""
+        return imgs.contiguous(memory_format=torch.channels_last) if self.channels_last else imgs
+
+    def autocast(self) -> torch.autocast:
+        """Context running the operations in the mixed precision dtype, if enabled."""
+        return torch.autocast(self.device_type, dtype=self.dtype, enabled=self.mixed_precision)
+
+    def _divergence(self, loss: torch.Tensor) -> str | None:
+        """Why *loss* shows diverging numerics, None if it does not."""
+        value = loss.item()
+        if not math.isfinite(value):
+            return f"non-finite loss ({value})"
+        if (
+            self._steps >= self.warmup_steps
+            and self._loss_average is not None
+            and value > self.divergence_ratio * self._loss_average
+        ):
+            return f"loss {value:.4g} above {self.divergence_ratio:g}x its average {self._loss_average:.4g}"
+        return None
+
+    def fall_back(self, reason: str) -> None:
+        """Train in fp32 from now on."""
+        print(f"[{self.mode}] {reason}, falling back to fp32")
+        self.fallback_reason = reason
+        self.mixed_precision = False
+        self.scaler = torch.amp.GradScaler(self.device_type, enabled=False)
+
+    def train_step(
+        self,
+        model: nn.Module,
+        imgs: torch.Tensor,
+        targets: torch.Tensor,
+        compute_loss: Callable[[object, torch.Tensor], tuple[torch.Tensor, torch.Tensor]],
+        optimizer: torch.optim.Optimizer,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """One optimization step on a batch, in the current mode.
+
+        Args:
+            model (nn.Module): Model in training mode.
+            imgs (torch.Tensor): Batch of images, on the device.
+            targets (torch.Tensor): Targets of the batch, on the device.
+            compute_loss (Callable): Returns the loss and its items from the predictions
+                and targets, e.g. YOLOv5's `ComputeLoss`.
+            optimizer (torch.optim.Optimizer): Optimizer of the model.
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: the loss, detached, and its items.
+        """
+        imgs = self.prepare_inputs(imgs)
+        optimizer.zero_grad()
+        with self.autocast():
+            loss, loss_items = compute_loss(model(imgs), targets)
+
+        if self.mixed_precision and (reason := self._divergence(loss)) is not None:
+            self.fall_back(reason)
+            loss, loss_items = compute_loss(model(imgs), targets)
+
+        self.scaler.scale(loss).backward()
+        self.scaler.step(optimizer)
+        self.scaler.update()
+
+        value = loss.item()
+        if math.isfinite(value):
+            self._loss_average = value if self._loss_average is None else 0.9 * self._loss_average + 0.1 * value
+        self._steps += 1
+        return loss.detach(), loss_items
@@ -39,7 +39,11 @@ DATASET_DIR = os.path.join(PROJECT_DIR, "dataset", "train")
 IMAGES_DIR = os.path.join(DATASET_DIR, "images")
 LABELS_DIR = os.path.join(DATASET_DIR, "labels")
 
-CLASS_NAMES = ["ferme", "immeuble", "maison", "piscine", "usine", "villa"]
+sys.path.insert(0, PROJECT_DIR)
+from miscellaneous.class_mapping import load_class_mapping  # noqa: E402
+from miscellaneous.label_index import LabelIndex, image_id_of  # noqa: E402
+
+CLASS_NAMES = load_class_mapping().class_names
 NC = len(CLASS_NAMES)
 COLORS = ["#2ecc71", "#3498db", "#e74c3c", "#00bcd4", "#9b59b6", "#f39c12"]
 IOU_THRESHOLD = 0.5
@@ -91,24 +95,13 @@ def scale_boxes(boxes, gain, pad, original_size):
     return boxes
 
 
-def load_gt_boxes(label_path, img_w, img_h):
-    """Load YOLO format ground truth and convert to xyxy pixels."""
-    boxes = []
-    if not os.path.exists(label_path):
-        return boxes
-    with open(label_path) as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) != 5:
-                continue
-            cls = int(parts[0])
-            xc, yc, bw, bh = [float(x) for x in parts[1:]]
-            x1 = (xc - bw / 2) * img_w
-            y1 = (yc - bh / 2) * img_h
-            x2 = (xc + bw / 2) * img_w
-            y2 = (yc + bh / 2) * img_h
-            boxes.append((cls, x1, y1, x2, y2))
-    return boxes
+def load_gt_boxes(image_id, img_w, img_h):
+    """Ground truth of an image from the label index, as xyxy pixels."""
+    gt = GT_BY_IMAGE.get(image_id)
+    if gt is None:
+        return []
+    xyxy = gt[["x1", "y1", "x2", "y2"]].to_numpy(np.float64) * [img_w, img_h, img_w, img_h]
+    return [(int(cls), *box) for cls, box in zip(gt["class"], xyxy.tolist())]
 
 
 def compute_iou(box1, box2):
@@ -128,6 +121,8 @@ def compute_iou(box1, box2):
 # ═══════════════════════════════════════════════════════
 print("Inférence sur toutes les images du dataset...")
 all_images = sorted(glob.glob(os.path.join(IMAGES_DIR, "*.jpg")))
+ground_truth = LabelIndex.load(LABELS_DIR).ground_truth([image_id_of(p) for p in all_images])
+GT_BY_IMAGE = {image_id: gt for image_id, gt in ground_truth.groupby("image")}
 
 # Per-class stats
 tp_per_class = collections.Counter()
@@ -170,9 +165,7 @@ for img_idx, img_path in enumerate(all_images):
             )
 
     # Ground truth boxes
-    label_fname = os.path.basename(img_path).replace(".jpg", ".txt")
-    label_path = os.path.join(LABELS_DIR, label_fname)
-    gt_boxes = load_gt_boxes(label_path, w0, h0)
+    gt_boxes = load_gt_boxes(image_id_of(img_path), w0, h0)
 
     total_gt += len(gt_boxes)
     total_pred += len(pred_boxes)
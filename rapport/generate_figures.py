@@ -10,7 +10,6 @@ Produit dans rapport/figures/ :
   - sample_grid.png         (grille 2x3 d'images du dataset)
 """
 
-import collections
 import os
 import sys
 
@@ -28,7 +27,11 @@ DATASET_DIR = os.path.join(PROJECT_DIR, "dataset", "train")
 FIGURES_DIR = os.path.join(SCRIPT_DIR, "figures")
 os.makedirs(FIGURES_DIR, exist_ok=True)
 
-CLASS_NAMES = ["ferme", "immeuble", "maison", "piscine", "usine", "villa"]
+sys.path.insert(0, PROJECT_DIR)
+from miscellaneous.class_mapping import load_class_mapping  # noqa: E402
+from miscellaneous.label_index import LabelIndex, image_id_of  # noqa: E402
+
+CLASS_NAMES = load_class_mapping().class_names
 COLORS = ["#2ecc71", "#3498db", "#e74c3c", "#00bcd4", "#9b59b6", "#f39c12"]
 
 # ═══════════════════════════════════════════════════════
@@ -185,18 +188,8 @@ print("[OK] loss_curve.png")
 # 2. DISTRIBUTION DES CLASSES
 # ═══════════════════════════════════════════════════════
 labels_dir = os.path.join(DATASET_DIR, "labels")
-counts = collections.Counter()
-for fname in os.listdir(labels_dir):
-    if not fname.endswith(".txt"):
-        continue
-    with open(os.path.join(labels_dir, fname)) as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                cls = int(line.split()[0])
-                counts[cls] += 1
-
-class_counts = [counts.get(i, 0) for i in range(6)]
+label_index = LabelIndex.load(labels_dir)
+class_counts = label_index.class_counts(len(CLASS_NAMES)).tolist()
 
 fig, ax = plt.subplots(figsize=(8, 4.5))
 bars = ax.bar(CLASS_NAMES, class_counts, color=COLORS, edgecolor="white", linewidth=1.2)
@@ -254,21 +247,10 @@ for ax, img_name in zip(axes.flat, selected):
     w, h = img.size
 
     # find matching label
-    label_name = img_name.replace(".jpg", ".txt")
-    label_path = os.path.join(labels_dir, label_name)
-    if os.path.exists(label_path):
-        with open(label_path) as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) == 5:
-                    cls = int(parts[0])
-                    xc, yc, bw, bh = [float(x) for x in parts[1:]]
-                    x1 = (xc - bw / 2) * w
-                    y1 = (yc - bh / 2) * h
-                    x2 = (xc + bw / 2) * w
-                    y2 = (yc + bh / 2) * h
-                    color = bbox_colors.get(cls, "white")
-                    draw.rectangle([x1, y1, x2, y2], outline=color, width=2)
+    gt = label_index.ground_truth([image_id_of(img_name)])
+    for cls, x1, y1, x2, y2 in gt[["class", "x1", "y1", "x2", "y2"]].itertuples(index=False):
+        color = bbox_colors.get(cls, "white")
+        draw.rectangle([x1 * w, y1 * h, x2 * w, y2 * h], outline=color, width=2)
 
     ax.imshow(img)
     ax.set_title(img_name.split("_png")[0].replace("image_", "Image "), fontsize=10)
@@ -278,7 +260,7 @@ for ax, img_name in zip(axes.flat, selected):
 import matplotlib.patches as mpatches
 
 legend_patches = [
-    mpatches.Patch(color=COLORS[i], label=CLASS_NAMES[i]) for i in range(6)
+    mpatches.Patch(color=COLORS[i], label=CLASS_NAMES[i]) for i in range(len(CLASS_NAMES))
 ]
 fig.legend(
     handles=legend_patches,
@@ -0,0 +1,87 @@
+import itertools
+
+import pytest
+import torch
+
+from miscellaneous.batch_augmentation import BatchAugmentation, flip_rot90_batch, mosaic_batch
+
+SIZE = 64
+
+
+def _batch(boxes):
+    """Images with a filled rectangle per (x1, y1, x2, y2) pixel box, and their targets."""
+    imgs = torch.zeros(len(boxes), 1, SIZE, SIZE)
+    targets = []
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        imgs[i, 0, y1:y2, x1:x2] = 1
+        targets.append([i, 3, (x1 + x2) / 2 / SIZE, (y1 + y2) / 2 / SIZE, (x2 - x1) / SIZE, (y2 - y1) / SIZE])
+    return imgs, torch.tensor(targets)
+
+
+def _box_of(mask):
+    ys, xs = torch.where(mask > 0)
+    x1, x2, y1, y2 = xs.min(), xs.max() + 1, ys.min(), ys.max() + 1
+    return torch.tensor([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]) / SIZE
+
+
+def test_flip_rot90_moves_boxes_with_pixels():
+    imgs, targets = _batch([(3, 5, 20, 11), (40, 10, 60, 50), (1, 1, 9, 30), (30, 40, 35, 62)] * 4)
+    hflip, vflip, k = (torch.tensor(values) for values in zip(*itertools.product([0, 1], [0, 1], range(4))))
+
+    out, new_targets = flip_rot90_batch(imgs, targets, hflip.bool(), vflip.bool(), k)
+
+    for row in new_targets:
+        assert torch.allclose(_box_of(out[int(row[0]), 0]), row[2:], atol=1e-6)
+
+
+def test_mosaic_keeps_targets_of_single_source_images():
+    imgs, targets = _batch([(16, 16, 48, 48), (0, 0, 8, 8), (56, 56, 64, 64)])
+    sources = torch.tensor([[0, 0, 0, 0], [1, 2, 1, 2], [2, 2, 2, 2]])
+
+    out, new_targets = mosaic_batch(imgs, targets, sources, (0.5, 0.5))
+
+    assert torch.equal(out[0], imgs[0])
+    assert torch.equal(new_targets[new_targets[:, 0] == 0], targets[targets[:, 0] == 0])
+    expected = targets[targets[:, 0] == 2].clone()
+    assert torch.equal(new_targets[new_targets[:, 0] == 2], expected)
+
+
+def test_mosaic_merges_quadrants_of_the_same_image():
+    # top half from image 0, bottom half from image 1: the box of image 0 crossing
+    # the center vertically stays one box, cut at the center line
+    imgs, targets = _batch([(16, 8, 48, 40), (0, 0, 8, 8)])
+    sources = torch.tensor([[0, 0, 1, 1], [1, 1, 1, 1]])
+
+    out, new_targets = mosaic_batch(imgs, targets, sources, (0.5, 0.5))
+
+    boxes = new_targets[new_targets[:, 0] == 0]
+    assert len(boxes) == 1
+    assert torch.allclose(boxes[0, 2:], _box_of(out[0, 0, :32]), atol=1e-6)
+
+
+def test_mosaic_drops_mostly_hidden_boxes():
+    imgs, targets = _batch([(24, 24, 36, 36), (0, 0, 8, 8)])
+    sources = torch.tensor([[0, 1, 1, 1], [1, 1, 1, 1]])
+
+    # 8x8 of the 12x12 box of image 0 are left in the top left quadrant
+    _, dropped = mosaic_batch(imgs, targets, sources, (0.5, 0.5), min_box_fraction=0.5)
+    _, kept = mosaic_batch(imgs, targets, sources, (0.5, 0.5), min_box_fraction=0.25)
+
+    assert not (dropped[:, 0] == 0).any()
+    assert torch.allclose(kept[kept[:, 0] == 0][0, 2:], torch.tensor([28, 28, 8, 8]) / SIZE)
+
+
+def test_batch_augmentation_without_mosaic_keeps_box_count():
+    generator = torch.Generator().manual_seed(0)
+    imgs = torch.rand(8, 3, 64, 64)
+    targets = torch.tensor([[i % 8, 1, 0.5, 0.5, 0.4, 0.4] for i in range(16)])
+
+    _, new_targets = BatchAugmentation(mosaic_p=0.0, generator=generator)(imgs, targets)
+
+    assert len(new_targets) == len(targets)
+    assert torch.allclose(new_targets[:, 4:], targets[:, 4:])
+
+
+def test_invalid_probability():
+    with pytest.raises(ValueError):
+        BatchAugmentation(mosaic_p=1.5)